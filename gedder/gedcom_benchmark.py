@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the GEDCOM transforms.
+
+Usage:
+    python3 gedcom_benchmark.py [--sizes 1000,10000] [--transforms kasteet,places]
+                                [--options="--mmap"] [--repeat N]
+                                [--save FILE] [--compare FILE] [--threshold PCT]
+
+Each transform listed by gedcom_transform.get_plugins() is run for generated
+files (see gedcom_generator.py) of the given numbers of persons. The files are
+generated with a fixed seed to the directory --corpus-dir and reused in the later
+runs. Each run is made in a process of its own, so that the module level data of
+the transforms and the peak memory use of a run do not affect the other runs.
+
+For each transform and size the results contain the lines per second, the seconds
+of each phase (see gedcom_transform.process_gedcom) and the peak resident set size
+in kilobytes. With --repeat the fastest run is reported.
+
+"--save FILE" writes the results to a JSON file. "--compare FILE" compares the results
+to a baseline saved earlier and reports the transforms which are more than
+--threshold percent (default 10) slower or use more memory than in the baseline;
+the exit status is then 1.
+"""
+
+import sys
+import os
+import json
+import shlex
+import argparse
+import datetime
+import platform
+import tempfile
+import importlib
+import subprocess
+import contextlib
+import logging
+
+import gedcom_transform
+from gedcom_generator import write_gedcom
+
+_VERSION = "1.0"
+_FORMAT = 1                 # Version of the results file
+_SIZES = "1000,10000"
+_SEED = 0
+
+
+def corpus_name(corpus_dir, persons, seed=_SEED):
+    return os.path.join(corpus_dir, "bench-{}-{}.ged".format(persons, seed))
+
+
+def get_corpus(corpus_dir, persons, seed=_SEED):
+    ''' Returns (file name, number of lines) of a generated file; the file is created if needed '''
+    name = corpus_name(corpus_dir, persons, seed)
+    if os.path.exists(name):
+        with open(name, "rb") as f:
+            count = sum(1 for _line in f)
+    else:
+        print("Luodaan {} ({} henkilöä)".format(name, persons), file=sys.stderr)
+        count = write_gedcom(name + ".tmp", persons, seed)
+        os.replace(name + ".tmp", name)
+    return name, count
+
+
+def benchmark_transforms(names=None):
+    ''' The names of the transforms to be measured (the ones producing an output file) '''
+    ret = []
+    for plugin in gedcom_transform.get_plugins():
+        if names and plugin.name not in names:
+            continue
+        if "phase3" in plugin.functions or "phase3_record" in plugin.functions:
+            ret.append(plugin.name)
+    return sorted(ret)
+
+
+def run_one(modname, input_gedcom, options):
+    ''' Runs a transform in this process and returns the phase times and the peak RSS '''
+    import resource
+    logging.basicConfig(level=logging.ERROR)
+    transformer = importlib.import_module("transforms." + modname)
+    parser = gedcom_transform.get_parser()
+    transformer.add_args(parser)
+    fd, output_gedcom = tempfile.mkstemp(suffix=".ged", dir=os.path.dirname(input_gedcom))
+    os.close(fd)
+    try:
+        run_args = vars(parser.parse_args([modname, input_gedcom, '--nolog',
+                                           '--output_gedcom', output_gedcom] + options))
+        # The messages printed by the transforms are not measured
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            times = gedcom_transform.process_gedcom(run_args, transformer, modname)
+    finally:
+        os.remove(output_gedcom)
+    return {'times': times,
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def measure(modname, input_gedcom, lines, options, repeat=1):
+    ''' Runs a transform in subprocesses and returns the result of the fastest run '''
+    best = None
+    for _ in range(repeat):
+        cmd = [sys.executable, os.path.abspath(__file__), '--child', modname, input_gedcom,
+               '--options=' + " ".join(shlex.quote(o) for o in options)]
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+        if proc.returncode != 0:
+            raise RuntimeError("Muunnos {} päättyi virheeseen".format(modname))
+        result = json.loads(proc.stdout)
+        if best is None or result['times']['total'] < best['times']['total']:
+            best = result
+    best['lines'] = lines
+    best['lines_per_second'] = round(lines / max(best['times']['total'], 1e-9))
+    return best
+
+
+def run_benchmarks(transforms, sizes, options, repeat, corpus_dir):
+    ''' Returns the results as a dict "transform/persons" -> result '''
+    results = {}
+    for persons in sizes:
+        input_gedcom, lines = get_corpus(corpus_dir, persons)
+        for modname in transforms:
+            key = "{}/{}".format(modname, persons)
+            results[key] = measure(modname, input_gedcom, lines, options, repeat)
+            print(format_result(key, results[key]))
+    return results
+
+
+def format_result(key, result):
+    times = result['times']
+    return "{:24} {:>9} riviä {:>9} riviä/s  phase1 {:6.2f} s  phase2 {:6.2f} s  " \
+           "phase3 {:6.2f} s  {:>8} kB".format(key, result['lines'], result['lines_per_second'],
+                                               times.get('phase1', 0), times.get('phase2', 0),
+                                               times.get('phase3', 0), result['max_rss_kb'])
+
+
+def save_results(name, results, options):
+    data = {
+        'format': _FORMAT,
+        'date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'options': options,
+        'results': results,
+    }
+    with open(name, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+
+
+def compare_results(baseline, results, threshold):
+    ''' Returns the descriptions of the regressions larger than threshold percent '''
+    regressions = []
+    limit = threshold / 100.0
+    for key, result in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        speed = result['lines_per_second'] / max(base['lines_per_second'], 1)
+        memory = result['max_rss_kb'] / max(base['max_rss_kb'], 1)
+        print("{:24} nopeus {:+6.1f} %  muisti {:+6.1f} %".format(key, (speed - 1) * 100,
+                                                                 (memory - 1) * 100))
+        if speed < 1 - limit:
+            regressions.append("{}: {} -> {} riviä/s".format(key, base['lines_per_second'],
+                                                              result['lines_per_second']))
+        if memory > 1 + limit:
+            regressions.append("{}: {} -> {} kB".format(key, base['max_rss_kb'],
+                                                         result['max_rss_kb']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the speed of the transforms")
+    parser.add_argument('--sizes', default=_SIZES,
+                        help="Comma separated numbers of persons in the generated files "
+                             "(default {})".format(_SIZES))
+    parser.add_argument('--transforms',
+                        help="Comma separated names of the transforms (default: all)")
+    parser.add_argument('--options', default="",
+                        help="Options given to gedcom_transform, e.g. --options=\"--mmap --single-pass\"")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="Number of runs of each transform; the fastest one is reported")
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), "gedder-bench"),
+                        help="Directory of the generated files")
+    parser.add_argument('--save', metavar='FILE', help="Write the results to a JSON file")
+    parser.add_argument('--compare', metavar='FILE', help="Compare the results to a saved baseline")
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help="Percentage of slowdown or memory growth reported as a regression")
+    parser.add_argument('--child', nargs=2, metavar=('TRANSFORM', 'INPUT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    options = shlex.split(args.options)
+
+    if args.child:
+        # A single run in a subprocess: the results to stdout as JSON
+        result = run_one(args.child[0], args.child[1], options)
+        json.dump(result, sys.stdout)
+        return 0
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)['results']
+    names = args.transforms.split(",") if args.transforms else None
+    transforms = benchmark_transforms(names)
+    if not transforms:
+        print("Transform not found; use gedcom_transform.py -l to list the available transforms")
+        return 2
+    sizes = [int(size) for size in args.sizes.split(",")]
+    os.makedirs(args.corpus_dir, exist_ok=True)
+    results = run_benchmarks(transforms, sizes, options, args.repeat, args.corpus_dir)
+    if args.save:
+        save_results(args.save, results, options)
+        print("Tulokset tiedostoon '{}'".format(args.save))
+    if baseline is not None:
+        regressions = compare_results(baseline, results, args.threshold)
+        for regression in regressions:
+            print("Hidastunut: " + regression)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
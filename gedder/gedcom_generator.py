@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+
+"""
+Synthetic GEDCOM file generator for testing and benchmarking the transforms.
+
+Usage:
+    python3 gedcom_generator.py OUTPUT [--persons N] [--seed S] [--encoding E]
+
+The output is a lineage-linked GEDCOM file with about N persons (about 12 lines
+per person). The name "-" means the standard output, and the output is compressed
+if the name ends with .gz, .bz2, .xz or .zip. The file is written in a streaming
+way, so the memory use does not depend on the size.
+
+The same seed produces always the same file. The content is Finnish and Swedish
+rural data of the 18th and 19th centuries, with the forms handled by the transforms:
+- patronymics ("Matintytär", "Matinp.", "Andersson", "Andersdr.")
+- surnames with "os." and "e." ("/Virtanen os. Mäkinen/")
+- "(kastettu)" birth places
+- places built from static/kylat.txt and static/seurakunnat.txt in different orders
+  ("Alakylä, Ahlainen", "Ahlainen Alakylä", "Ahlainen")
+- marriage places "parish, (village1/village2)"
+- Brothers Keeper style source titles separated by ";"
+
+The generator can be used also as a module:
+    for line in GedcomGenerator(seed=1).lines(10000): ...
+"""
+
+import sys
+import random
+import argparse
+from collections import deque
+
+from transforms.model.gedcom_io import open_output
+
+_VERSION = "1.0"
+_QUEUE_SIZE = 5000      # Unmarried persons waiting for a spouse
+_BATCH_LINES = 4096     # Number of lines written with one write call
+
+_FI_MALE = [("Matti", "Matin"), ("Juho", "Juhon"), ("Antti", "Antin"), ("Heikki", "Heikin"),
+            ("Pekka", "Pekan"), ("Jaakko", "Jaakon"), ("Erkki", "Erkin"), ("Olli", "Ollin"),
+            ("Paavo", "Paavon"), ("Tuomas", "Tuomaan"), ("Lauri", "Laurin"), ("Mikko", "Mikon"),
+            ("Simo", "Simon"), ("Juhana", "Juhanan"), ("Kustaa", "Kustaan"),
+            ("Henrik", "Henrikin"), ("Eerik", "Eerikin"), ("Yrjö", "Yrjön")]
+_FI_FEMALE = ["Maria", "Anna", "Kaisa", "Liisa", "Helena", "Valpuri", "Kristiina", "Brita",
+              "Susanna", "Margareeta", "Elisabet", "Beata", "Katariina", "Saara", "Riitta"]
+_SV_MALE = ["Anders", "Erik", "Johan", "Per", "Nils", "Lars", "Karl", "Gustaf", "Jakob",
+            "Mats", "Henrik", "Olof"]
+_SV_FEMALE = ["Maria", "Anna", "Brita", "Kajsa", "Lisa", "Greta", "Stina", "Karin", "Elsa",
+              "Sofia", "Helena"]
+_FI_SURNAMES = ["Mäkinen", "Virtanen", "Heikkilä", "Koskinen", "Niemi", "Mattila", "Laine",
+                "Järvinen", "Hämäläinen", "Korhonen", "Lehtonen", "Peltola", "Salminen",
+                "Kallio", "Rantanen", "Huttunen", "Pelkonen", "Airola", "Silius", "Sihvola"]
+_SV_SURNAMES = ["Lindqvist", "Sjöberg", "Holmström", "Nyström", "Berg", "Lind", "Åberg",
+                "Söderholm", "Forsman", "Ekman", "Grönroos", "Westerlund"]
+_BABIES = ["(poikavauva)", "(tyttövauva)", "(lapsi)", "(son)", "(dotter)", "(barn)"]
+_MONTHS = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"]
+_BOOKS = ["RK", "LK", "syntyneet", "vihityt", "pääkirja"]
+_CHARSETS = {"utf-8": "UTF-8", "ansel": "ANSEL", "cp1252": "ANSI", "cp437": "IBMPC"}
+
+
+def read_places(parishfile, villagefile):
+    ''' Returns the parishes and a dict parish -> villages from the static files '''
+    villages = {}
+    with open(villagefile, encoding="utf-8") as f:
+        for line in f:
+            if ":" in line:
+                parish, village = line.split(":", 1)
+                villages.setdefault(parish.strip(), []).append(village.strip())
+    parishes = list(villages)
+    with open(parishfile, encoding="utf-8") as f:
+        for line in f:
+            tkns = line.split(None, 1)
+            if len(tkns) == 2 and tkns[1][0].isalpha():
+                # "Petsamon ortodoksinen srk - Petsamo"
+                parish = tkns[1].split(" - ")[0].strip()
+                if parish not in villages:
+                    parishes.append(parish)
+    return parishes, villages
+
+
+class Person(object):
+    ''' A person whose INDI record has not been written yet '''
+    __slots__ = ('xref', 'sex', 'given', 'patronym', 'surname', 'birth', 'famc')
+
+    def __init__(self, xref, sex, given, patronym, surname, birth, famc=None):
+        self.xref = xref
+        self.sex = sex
+        self.given = given
+        self.patronym = patronym
+        self.surname = surname
+        self.birth = birth      # year
+        self.famc = famc
+
+
+class GedcomGenerator(object):
+    '''
+    Generates the lines of a GEDCOM file.
+
+    The families are created one by one. The spouses are taken from the
+    unmarried children of the earlier families or created as new persons,
+    so the records refer to each other like in a real family tree.
+    '''
+
+    def __init__(self, seed=0, parishfile="static/seurakunnat.txt",
+                 villagefile="static/kylat.txt", encoding="utf-8"):
+        self.rand = random.Random(seed)
+        self.seed = seed
+        self.encoding = encoding
+        self.parishes, self.villages = read_places(parishfile, villagefile)
+        self.village_parishes = [p for p in self.parishes if len(self.villages.get(p, ())) > 1]
+        self.persons = 0
+        self.families = 0
+        self.sources = 0
+        self.unmarried = {'M': deque(), 'F': deque()}
+
+    def lines(self, persons):
+        ''' Yields the lines of a file with about the given number of persons '''
+        self.sources = max(10, persons // 200)
+        yield from self.header()
+        while self.persons < persons:
+            yield from self.family()
+        for sex in ('M', 'F'):
+            while self.unmarried[sex]:
+                yield from self.person(self.unmarried[sex].popleft())
+        for num in range(1, self.sources + 1):
+            yield from self.source(num)
+        yield "0 TRLR"
+
+    def header(self):
+        rand = self.rand
+        return ["0 HEAD",
+                "1 SOUR gedcom_generator",
+                "2 VERS " + _VERSION,
+                "1 SUBM @SUBM@",
+                "1 GEDC",
+                "2 VERS 5.5",
+                "2 FORM LINEAGE-LINKED",
+                "1 CHAR " + _CHARSETS.get(self.encoding.lower(), self.encoding.upper()),
+                "1 LANG Finnish",
+                "1 NOTE Generated with seed {}".format(self.seed),
+                "0 @SUBM@ SUBM",
+                "1 NAME " + rand.choice(_FI_MALE)[0] + " " + rand.choice(_FI_SURNAMES)]
+
+    # --- Names, dates and places
+
+    def new_person(self, sex, swedish, father=None, surname=None, birth=None, famc=None):
+        ''' Creates a person; the patronymic is formed from the father's name '''
+        rand = self.rand
+        self.persons += 1
+        if swedish:
+            given = rand.choice(_SV_MALE if sex == 'M' else _SV_FEMALE)
+        elif sex == 'M':
+            given = rand.choice(_FI_MALE)[0]
+        else:
+            given = rand.choice(_FI_FEMALE)
+        if rand.random() < 0.15:
+            # A second given name, the call name marked with "*"
+            given = given + "* " + rand.choice(_FI_FEMALE if sex == 'F' else _SV_MALE)
+        if father is None:
+            father = rand.choice(_SV_MALE) if swedish else rand.choice(_FI_MALE)[0]
+        patronym = self.patronym(father, sex, swedish)
+        if surname is None and rand.random() < 0.8:
+            surname = rand.choice(_SV_SURNAMES if swedish else _FI_SURNAMES)
+        if birth is None:
+            birth = rand.randint(1700, 1760)
+        return Person("@I{}@".format(self.persons), sex, given, patronym, surname or "",
+                      birth, famc)
+
+    def patronym(self, father, sex, swedish):
+        rand = self.rand
+        father = father.split("*")[0]
+        abbreviated = rand.random() < 0.1
+        if swedish:
+            base = father if father.endswith("s") else father + "s"
+            if sex == 'M':
+                return base + ("s." if abbreviated else "son")
+            return base + ("dr." if abbreviated else "dotter")
+        genitive = dict(_FI_MALE).get(father, father + "in")
+        if sex == 'M':
+            return genitive + ("p." if abbreviated else "poika")
+        return genitive + ("t." if abbreviated else "tytär")
+
+    def date(self, year):
+        rand = self.rand
+        r = rand.random()
+        if r < 0.1:
+            return str(year)
+        if r < 0.15:
+            return "ABT " + str(year)
+        return "{} {} {}".format(rand.randint(1, 28), rand.choice(_MONTHS), year)
+
+    def place(self, parish=None):
+        ''' A place in one of the forms used in the old files '''
+        rand = self.rand
+        if parish is None:
+            parish = rand.choice(self.parishes)
+        villages = self.villages.get(parish)
+        r = rand.random()
+        if not villages or r < 0.2:
+            return parish
+        village = rand.choice(villages)
+        if r < 0.8:
+            return village + ", " + parish
+        if r < 0.9:
+            return parish + ", " + village
+        return parish + " " + village
+
+    def marriage_place(self):
+        ''' Usually a place, sometimes "parish, (husband's village/wife's village)" '''
+        rand = self.rand
+        if rand.random() < 0.15:
+            parish = rand.choice(self.village_parishes)
+            husb, wife = rand.sample(self.villages[parish], 2)
+            return "{}, ({}/{})".format(parish, husb, wife)
+        return self.place()
+
+    def source_ref(self, level):
+        rand = self.rand
+        return ["{} SOUR @S{}@".format(level, rand.randint(1, self.sources)),
+                "{} PAGE s. {}".format(level + 1, rand.randint(1, 400))]
+
+    # --- Records
+
+    def person(self, person, fams=None, husband=None):
+        ''' The INDI record of a person '''
+        rand = self.rand
+        surname = person.surname
+        if husband is not None and husband.surname and surname and husband.surname != surname:
+            surname = husband.surname + " os. " + surname
+        elif surname and rand.random() < 0.03:
+            surname = surname + " e. " + rand.choice(_FI_SURNAMES)
+        if rand.random() < 0.01:
+            name = rand.choice(_BABIES) + " //"
+        else:
+            name = "{} {} /{}/".format(person.given, person.patronym, surname)
+        lines = ["0 {} INDI".format(person.xref),
+                 "1 NAME " + name,
+                 "1 SEX " + person.sex,
+                 "1 BIRT",
+                 "2 DATE " + self.date(person.birth)]
+        place = self.place()
+        if rand.random() < 0.05:
+            place = "(kastettu) " + place
+        lines.append("2 PLAC " + place)
+        if rand.random() < 0.4:
+            lines.extend(self.source_ref(2))
+        if rand.random() < 0.7:
+            lines.append("1 DEAT")
+            lines.append("2 DATE " + self.date(person.birth + rand.randint(0, 90)))
+            lines.append("2 PLAC " + self.place())
+        if person.famc:
+            lines.append("1 FAMC " + person.famc)
+        if fams:
+            lines.append("1 FAMS " + fams)
+        return lines
+
+    def spouse(self, sex, swedish):
+        ''' An unmarried child of an earlier family or a new person '''
+        queue = self.unmarried[sex]
+        if queue and self.rand.random() < 0.8:
+            return queue.popleft()
+        return self.new_person(sex, swedish)
+
+    def family(self):
+        ''' Yields the lines of a new family and the records of the spouses '''
+        rand = self.rand
+        self.families += 1
+        fam = "@F{}@".format(self.families)
+        swedish = rand.random() < 0.3
+        husband = self.spouse('M', swedish)
+        wife = self.spouse('F', swedish)
+        year = max(husband.birth, wife.birth) + rand.randint(18, 35)
+        lines = ["0 {} FAM".format(fam),
+                 "1 HUSB " + husband.xref,
+                 "1 WIFE " + wife.xref,
+                 "1 MARR",
+                 "2 DATE " + self.date(year),
+                 "2 PLAC " + self.marriage_place()]
+        if rand.random() < 0.2:
+            lines.extend(self.source_ref(2))
+        for _ in range(rand.choice((0, 1, 2, 2, 3, 3, 4, 5, 6, 8))):
+            sex = rand.choice("MF")
+            child = self.new_person(sex, swedish, husband.given, husband.surname,
+                                    year + rand.randint(1, 20), fam)
+            lines.append("1 CHIL " + child.xref)
+            queue = self.unmarried[sex]
+            queue.append(child)
+            if len(queue) > _QUEUE_SIZE:
+                # Never married
+                yield from self.person(queue.popleft())
+        yield from lines
+        yield from self.person(husband, fam)
+        yield from self.person(wife, fam, husband)
+
+    def source(self, num):
+        ''' A source with a Brothers Keeper style title "parish RK 1750-1760 s. 12; ..." '''
+        rand = self.rand
+        parts = []
+        for _ in range(rand.choice((1, 1, 1, 2, 3))):
+            start = rand.randint(1700, 1880)
+            parts.append("{} {} {}-{} s. {}".format(rand.choice(self.parishes),
+                                                     rand.choice(_BOOKS), start,
+                                                     start + rand.randint(1, 20),
+                                                     rand.randint(1, 400)))
+        return ["0 @S{}@ SOUR".format(num),
+                "1 TITL " + "; ".join(parts)]
+
+
+def write_gedcom(name, persons, seed=0, encoding="utf-8"):
+    ''' Writes a generated file; returns the number of lines '''
+    generator = GedcomGenerator(seed, encoding=encoding)
+    count = 0
+    batch = []
+    with open_output(name, encoding) as f:
+        for line in generator.lines(persons):
+            batch.append(line)
+            if len(batch) >= _BATCH_LINES:
+                batch.append("")
+                f.write("\n".join(batch))
+                count += len(batch) - 1
+                batch = []
+        batch.append("")
+        f.write("\n".join(batch))
+        count += len(batch) - 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic GEDCOM file")
+    parser.add_argument('output_gedcom', help="Name of the output file; '-' for stdout, "
+                        "compressed if the name ends with .gz, .bz2, .xz or .zip")
+    parser.add_argument('--persons', type=int, default=1000,
+                        help="Number of persons (about 12 lines each)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Seed of the random numbers; the same seed gives the same file")
+    parser.add_argument('--encoding', type=str, default="utf-8",
+                        help="e.g. UTF-8, ANSEL, cp1252")
+    args = parser.parse_args()
+    count = write_gedcom(args.output_gedcom, args.persons, args.seed, args.encoding)
+    print("{} riviä tiedostoon '{}'".format(count, args.output_gedcom), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
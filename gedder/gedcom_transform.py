@@ -10,17 +10,79 @@ Parameters of main():
  1. The name of the plugin. This can be the name of the Python file ("module.py")
     or just the name of the module ("module").
     In both case the .py file must be in the current directory or on the PYTHONPATH.
+    Several plugins can be chained with "+", e.g. "kasteet+marriages+places+names".
+    The output of each plugin is passed in memory to the next one and only the
+    last one writes the output file, so the file is read and written only once
+    (plus the phase1 reading of the first plugin).
 
  2. The name of the input GEDCOM file. This is also the name of the output file.
+    The name "-" means the standard input, and then the output is written to the
+    standard output (unless "--output_gedcom" is given) and the messages to stderr.
+    A gzip, bzip2, xz or zip compressed input is decompressed while reading, and
+    the output is compressed in the same way. "--output_gedcom" may also be "-" and
+    its compression is selected by the suffix of the name (.gz, .bz2, .xz or .zip).
 
  3. "--encoding" [optional] specifies the character encoding used to read and write
-    the GEDCOM files. The default is UTF-8.
+    the GEDCOM files. The default "auto" detects it from the byte order mark or the
+    "1 CHAR" line of the header (UTF-8, ANSEL, ANSI, IBMPC, MACINTOSH, UNICODE).
+    Text which is valid UTF-8 is read as UTF-8. An input which can't be decoded with
+    the encoding ends the program without writing the output.
 
  4. "--display_changes" [optional] can be specified to allow the plugins to
     show the modification. The plugin must implement the logic to do that.
 
  5. "--dryrun" [optional] means that no changes are saved and the input file is not modified.
 
+ 6. "--single-pass" [optional] reads the input file only once. The lines read in phase1 are
+    kept and replayed to phase3. If the lines take more than "--memory-budget" megabytes
+    (default 256) they are stored to a temporary file instead.
+
+ 7. "--mmap" [optional] reads the input file through a memory map. The lines are split
+    and parsed from the raw bytes and the values are decoded only when a plugin uses
+    them. This requires an encoding where the level numbers and tags are ASCII bytes
+    (e.g. UTF-8 or ISO8859-1); otherwise the file is read as text.
+
+ 8. "--jobs" [optional] runs phase3 in the given number of processes. The input is split
+    to chunks of whole level 0 records and the results are written in the original order.
+    This is used only for plugins which declare "parallel_safe = True", i.e. their phase3
+    depends only on the record itself and on the data loaded by initialize().
+    The core then sets run_args['parallel_phase3'], as the finalize() of the plugin
+    does not see the data collected by phase3 in the worker processes.
+
+ 9. "--index" [optional] creates or updates the record index "<input>.gedidx" beside
+    the input file in the beginning of the run. The index contains the position,
+    type and xref of each level 0 record; it is built again only when the input file
+    has changed. The index is given to the plugins in run_args['gedcom_index'] and
+    they can read single records with read_record() and read_records_of_type() of
+    transforms.model.gedcom_index. The "info" transform uses it for counting the
+    records. A compressed input or the standard input is not indexed.
+
+10. "--incremental [cachefile]" [optional] stores the output of each level 0 record to a
+    cache (default "transform_cache.db"). The key of the cache contains the name, version
+    and arguments of the plugin. When the same record is met again, the stored lines are
+    written without calling phase3. This is used for the plugins declaring
+    "parallel_safe = True" without phase1 and for the plugins with the function
+    cache_state(run_args), which returns a string describing the data collected in
+    phase1 and phase2; when it changes, all the records are transformed again.
+
+11. "--profile" [optional] logs the wall and CPU time of each phase, the time used in
+    each callback of the transforms and in writing the output (the rest is "core"),
+    and the number of calls and the time per tag. "--profile-output NAME" also writes
+    a cProfile profile to NAME.pstats and the sampled call stacks to NAME.folded
+    (the input of flamegraph.pl); it implies --profile.
+
+12. "--progress [SECONDS]" [optional] reports the progress of the run every SECONDS
+    seconds (default 10) to stderr, or to the log with "--progress-log": the phase,
+    the percentage of the input read, the lines and records per second and the
+    estimated time left of the phase. A program using process_gedcom() can set
+    run_args['progress_callback'] to a function, which gets each report as a
+    transforms.model.progress.ProgressInfo tuple.
+
+13. "--memstats" [optional] traces the memory allocations with tracemalloc and logs at
+    the end of each phase the allocated memory, its peak during the phase, the peak
+    resident set size, the numbers of GedcomLine, PersonName and GedcomRecord objects
+    and the source lines where the allocated memory grew most during the phase.
+
 If the --dryrun parameter is not specified then the original input file is
 renamed by adding a sequence number to the file name and the new version of
 the file is saved with the same name as the input file. These names are displayed at the
@@ -34,6 +96,12 @@ A plugin may contain the following functions:
 - phase2(run_args)                                  # [optional] called between phase1 and phase2
 - phase3(run_args,line,level,path,tag,value,output_file)
                                                 # [optional] called once per GEDCOM line
+- phase3_record(run_args,record,output_file)    # [optional] called once per level 0 record
+                                                # instead of phase3
+- cache_state(run_args)                         # [optional] the phase1/phase2 data for --incremental
+- need_phase1(run_args)                         # [optional] False skips phase1 in this run
+- skip_output(run_args)                         # [optional] True runs only phase1 and phase2
+- finalize(run_args)                            # [optional] called once at the end of the transformation
 
 The function "add_args" is called in the beginning of the program and it allows
 the plugin to add its own arguments for the program. The values of the arguments
@@ -43,6 +111,12 @@ Function "initialize" is called in the beginning of the transformation.
 
 If function "phase1" is defined, it is called once for each line in the input GEDCOM file.
 It can be used to collect information to be used in the subsequent phases.
+If the plugin defines "need_phase1" and it returns False, phase1 is not run and
+the input file is not read for it (e.g. when phase1 is used only by some option).
+While reading the lines for phase1 the core builds the table run_args['xref_table']
+of the level 0 records and the pointers (HUSB, WIFE, CHIL, FAMS, FAMC, SOUR, NOTE)
+between them, see transforms.model.xref_table. In phase1 it contains the lines read
+so far, in phase2 and phase3 the whole input.
 
 Function "phase2" may be defined for processing all the information got from phase1
 before phase3.
@@ -53,6 +127,21 @@ for each line in the output file.
 If an input line is not modified then emit should be called with the original line
 as it's parameter.
 
+If function "phase3_record" is defined, it is called instead of "phase3" once for
+each level 0 record with all it's lines (a transforms.model.record_lines.RecordLines
+object). The unmodified lines can be written with record.emit(output_file).
+
+Function "finalize" may be defined for reporting e.g. statistics to the log after
+the output has been written.
+
+If function "skip_output" is defined and it returns True (e.g. for a report made by
+the plugin), the input file is read only once for phase1 and phase2 and no output
+file is written; the input file is not modified. The lines are not kept and
+run_args['xref_table'] is not built, so the memory used depends only on the data
+collected by the plugin. It is called only for the last transform of a chain.
+As the report may be written to the standard output, the messages printed by the
+program and the plugins then go to stderr.
+
 The parameters of each phases:
 - "run_args"    a dict object from the object returned by ArgumentParser.parse_args 
                 or from gedder.py options.
@@ -61,6 +150,10 @@ The parameters of each phases:
     - "level",  the level number of the line (integer)
     - "path",   the current hierarchy of the GEDCOM tags, e.g @I123@.BIRT.DATE
                 representing the DATE tag inside the BIRT tag for the individual @I123@.
+    - "xref",   the first part of the path, i.e. the record id @I123@
+    - "path_id", an integer id for the rest of the path (BIRT.DATE); use
+                transforms.model.gedcom_path.PathPattern("*.BIRT.DATE").match(gedline)
+                instead of string operations on the path
     - "tag",    the current tag (last part of path)
     - "value",  the value for the current tag, e.g. a date or a name
 - "output_file" is a file-like object containing the method emit(string) 
@@ -68,107 +161,642 @@ The parameters of each phases:
 """
 _VERSION="0.3"
 _LOGFILE="transform.log"
+_MEMORY_BUDGET=256      # Megabytes of parsed lines kept in memory by --single-pass
+_JOB_LINES=2000         # Minimum number of lines in a chunk given to a --jobs worker
+_CACHEFILE="transform_cache.db"
+_PROGRESS_INTERVAL=10.0 # Default seconds between the progress reports
+_CALLBACK_INTERVAL=1.0  # Seconds between the calls of run_args['progress_callback'] without --progress
+# Options which do not affect the transformed lines
+_RUN_OPTIONS={'transform', 'input_gedcom', 'output_gedcom', 'display_changes', 'dryrun',
+              'nolog', 'encoding', 'mmap', 'write_buffer', 'single_pass', 'memory_budget',
+              'jobs', 'index', 'gedcom_index', 'incremental', 'list', 'xref_table',
+              'profile', 'profile_output', 'progress', 'progress_log',
+              'progress_callback', 'progress_meter', 'memstats', 'memory_stats',
+              'parallel_phase3'}
 
 import sys
 import os
 import argparse
+import codecs
+import mmap
 import importlib
 import datetime
+import time
+import io
+import itertools
+import collections
+import contextlib
 import logging
 LOG = logging.getLogger(__name__)
 
-from transforms.model.gedcom_line import GedcomLine
-from transforms.model.ged_output import Output
+from transforms.model.gedcom_line import GedcomLine, LazyGedcomLine
+from transforms.model.ged_output import Output, LineSink
+from transforms.model.gedcom_path import PathTracker
+from transforms.model.gedcom_io import open_input, is_stream, is_plain_file, \
+    bytes_compatible, bytes_encoding, sniff_encoding, input_size, input_position
+from transforms.model.record_lines import group_records
+from transforms.model.line_buffer import LineBuffer
+from transforms.model.xref_table import XrefTable
+from transforms.model.progress import Progress
+from transforms.model.plugin_manifest import get_plugins as get_plugin_manifest
 
 def numeric(s):
     return s.replace(".","").isdigit()
 
 
-def read_gedcom(run_args):
-    
+@contextlib.contextmanager
+def input_errors(run_args):
+    ''' Logs the errors of reading the input file; other than a missing file
+        or a wrong encoding end the input silently
+    '''
     try:
-        for linenum, line in enumerate(open(run_args['input_gedcom'], encoding=run_args['encoding'])):
-            # Clean the line
-            line = line[:-1]
-            if line[0] == "\ufeff": 
-                line = line[1:]
-            # Return a gedcom line object
-            gedline = GedcomLine(line, linenum)
-            yield gedline
-
+        yield
     except FileNotFoundError:
         LOG.error("Tiedostoa '{}' ei ole!".format(run_args['input_gedcom']))
         raise
+    except UnicodeDecodeError as err:
+        LOG.error("Väärä merkistö %s tiedostossa '%s': %s",
+                  run_args['encoding'], run_args['input_gedcom'], err)
+        raise
     except Exception as err:
         LOG.error(type(err))
         LOG.error("Virhe: {0}".format(err))
 
 
+def resolve_encoding(run_args):
+    ''' Replaces the encoding "auto" with the encoding detected from the input '''
+    if run_args.get('encoding', 'auto').lower() == 'auto':
+        with input_errors(run_args):
+            run_args['encoding'] = sniff_encoding(run_args['input_gedcom'])
+        LOG.info("Merkistö %s", run_args['encoding'])
+    return run_args['encoding']
+
+
+def read_gedcom(run_args, tracker=None):
+    
+    with input_errors(run_args):
+        if run_args.get('mmap') and not is_plain_file(run_args['input_gedcom']):
+            LOG.info("Syötettä ei voi lukea --mmap-tavalla, luetaan tekstinä")
+        elif run_args.get('mmap') and bytes_compatible(run_args['encoding']):
+            for gedline in read_gedcom_mmap(run_args, tracker):
+                yield gedline
+            return
+        elif run_args.get('mmap'):
+            LOG.warning("Merkistö %s ei sovi --mmap-lukuun, luetaan tekstinä", run_args['encoding'])
+
+        for linenum, line in read_lines(run_args):
+            # Return a gedcom line object
+            gedline = GedcomLine(line, linenum, tracker)
+            yield gedline
+
+
+def read_lines(run_args):
+    ''' Reads the input file as (line number, line) pairs without parsing the lines '''
+    with open_input(run_args['input_gedcom'], run_args['encoding']) as f:
+        lines = f
+        progress = run_args.get('progress_meter')
+        if progress:
+            position = input_position(f)
+            size = input_size(run_args['input_gedcom']) if position else None
+            lines = progress.track(f, size, position)
+        for linenum, line in enumerate(lines):
+            # Clean the line
+            line = line[:-1]
+            if line[:1] == "\ufeff": 
+                line = line[1:]
+            if not line:
+                # A blank line is skipped, but counted as with --mmap
+                continue
+            yield linenum, line
+
+
+def read_gedcom_mmap(run_args, tracker=None):
+    ''' Reads the input file through a memory map.
+        The lines are split from the raw bytes and only the level and tag are
+        decoded here; the values are decoded when a transform uses them.
+    '''
+    encoding = bytes_encoding(run_args['encoding'])
+    with open(run_args['input_gedcom'], 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if buf[:3] == codecs.BOM_UTF8:
+                buf.seek(3)
+            linenum = 0
+            raws = iter(buf.readline, b"")
+            progress = run_args.get('progress_meter')
+            if progress:
+                raws = progress.track(raws, len(buf), buf.tell)
+            for raw in raws:
+                raw = raw.rstrip(b"\r\n")
+                if raw:
+                    yield LazyGedcomLine(raw, linenum, encoding, tracker)
+                linenum += 1
+
+
+def prepare_phase3(run_args, transformer, gedlines, tracker, buffers, times=None):
+    ''' Runs phase1 and phase2 of a transform and returns the lines for it's phase3.
+        gedlines is None when the transform reads the input file, otherwise
+        it is the output of the previous transform in a chain.
+        Returns None, if phase3 should read the input file.
+        The seconds used are added to times['phase1'] and times['phase2'] and
+        the CPU seconds to times['phase1_cpu'] and times['phase2_cpu'].
+    '''
+    if times is None:
+        times = collections.Counter()
+    # 1st traverse
+    start = time.perf_counter()
+    cpu = time.process_time()
+    if uses_phase1(run_args, transformer):
+        set_phase(run_args, "phase1", transformer)
+        # The records and pointers read so far, see transforms.model.xref_table
+        table = XrefTable()
+        run_args['xref_table'] = table
+        if gedlines is None and not run_args.get('single_pass'):
+            for gedline in read_gedcom(run_args, tracker):
+                table.add(gedline)
+                transformer.phase1(run_args, gedline)
+        else:
+            # Keep the parsed lines for phase3
+            budget = run_args.get('memory_budget', _MEMORY_BUDGET)
+            replay = LineBuffer(budget * 1024 * 1024)
+            buffers.append(replay)
+            if gedlines is None:
+                gedlines = read_gedcom(run_args, tracker)
+            for gedline in gedlines:
+                replay.append(gedline)
+                table.add(gedline)
+                transformer.phase1(run_args, gedline)
+            if replay.spilled:
+                LOG.info("Rivit siirretty väliaikaistiedostoon (%s riviä)", len(replay))
+            gedlines = replay.replay(tracker)
+            progress = run_args.get('progress_meter')
+            if progress:
+                gedlines = progress.track(gedlines, len(replay), None,
+                                          lambda gedline: gedline.level == 0)
+        table.close()
+        memory_snapshot(run_args, "phase1", transformer)
+    times['phase1'] += time.perf_counter() - start
+    times['phase1_cpu'] += time.process_time() - cpu
+
+    # Intermediate processing of collected data
+    start = time.perf_counter()
+    cpu = time.process_time()
+    if hasattr(transformer,"phase2"):
+        transformer.phase2(run_args)
+        memory_snapshot(run_args, "phase2", transformer)
+    times['phase2'] += time.perf_counter() - start
+    times['phase2_cpu'] += time.process_time() - cpu
+
+    # None means that phase3 reads the input file
+    return gedlines
+
+
+def uses_phase1(run_args, transformer):
+    ''' True, if phase1 of the transform is run with these arguments '''
+    if not hasattr(transformer, "phase1"):
+        return False
+    if hasattr(transformer, "need_phase1"):
+        return transformer.need_phase1(run_args)
+    return True
+
+
+def skips_output(run_args, transformer):
+    ''' True, if the transform does not write the output with these arguments '''
+    return hasattr(transformer, "skip_output") and transformer.skip_output(run_args)
+
+
+def run_without_output(run_args, transformer, gedlines, tracker, times):
+    ''' Runs phase1 and phase2 of a transform which does not write the output,
+        see skip_output(). The lines are read once and not kept.
+    '''
+    start = time.perf_counter()
+    cpu = time.process_time()
+    if gedlines is None:
+        gedlines = read_gedcom(run_args, tracker)
+    if hasattr(transformer, "phase1"):
+        set_phase(run_args, "phase1", transformer)
+        for gedline in gedlines:
+            transformer.phase1(run_args, gedline)
+        memory_snapshot(run_args, "phase1", transformer)
+    else:
+        for _ in gedlines:
+            pass
+    times['phase1'] += time.perf_counter() - start
+    times['phase1_cpu'] += time.process_time() - cpu
+
+    start = time.perf_counter()
+    cpu = time.process_time()
+    if hasattr(transformer, "phase2"):
+        transformer.phase2(run_args)
+        memory_snapshot(run_args, "phase2", transformer)
+    times['phase2'] += time.perf_counter() - start
+    times['phase2_cpu'] += time.process_time() - cpu
+
+
+def set_phase(run_args, phase, transformer):
+    ''' Sets the phase shown in the progress reports '''
+    progress = run_args.get('progress_meter')
+    if progress:
+        progress.phase = "{} {}".format(phase, transformer.__name__.split(".")[-1])
+
+
+def memory_snapshot(run_args, phase, transformer=None):
+    ''' Logs the memory use at the end of a phase with --memstats '''
+    stats = run_args.get('memory_stats')
+    if stats:
+        if transformer is not None:
+            phase = "{} {}".format(phase, transformer.__name__.split(".")[-1])
+        stats.snapshot(phase)
+
+
+def read_records(run_args, tracker=None):
+    ''' Reads the input file and returns the level 0 records as RecordLines objects '''
+    return group_records(read_gedcom(run_args, tracker))
+
+
+def run_phase3(run_args, transformer, gedlines, f, tracker):
+    ''' Calls phase3 (and phase4 before TRLR) of a transform for each line.
+        Yields after each input line, so that the caller can pass the
+        emitted lines forward.
+    '''
+    do_phase4 = hasattr(transformer,"phase4")
+    if hasattr(transformer,"phase3_record"):
+        yield from run_phase3_record(run_args, transformer, gedlines, f, do_phase4)
+        return
+    display = f.display_changes
+    phase3 = transformer.phase3
+    for gedline in gedlines:
+        # The lines created by the transform follow the path of it's input
+        GedcomLine.tracker = tracker
+        if do_phase4 and gedline.tag == "TRLR":
+            f.original_line = ""
+            transformer.phase4(run_args, f)
+        if display:
+            f.original_line = gedline.line.strip()
+        phase3(run_args, gedline, f)
+        yield
+
+
+def run_phase3_record(run_args, transformer, gedlines, f, do_phase4):
+    ''' Calls phase3_record of a transform for each level 0 record.
+        Yields after each record.
+    '''
+    # The input is read one line ahead, so the lines created by the
+    # transform get their paths from a tracker of their own
+    record_tracker = PathTracker()
+    phase3_record = transformer.phase3_record
+    for record in group_records(gedlines):
+        GedcomLine.tracker = record_tracker
+        record_tracker.set(0, record.xref)
+        f.original_line = ""
+        if do_phase4 and record.tag == "TRLR":
+            transformer.phase4(run_args, f)
+        phase3_record(run_args, record, f)
+        yield
+
+
+def chain_lines(run_args, transformer, gedlines, tracker, next_tracker):
+    ''' Runs phase3 of a transform in the middle of a chain and yields the
+        emitted lines as GedcomLines for the next transform.
+    '''
+    sink = LineSink()
+    linenum = 0
+    for _ in run_phase3(run_args, transformer, gedlines, sink, tracker):
+        for line in sink.take():
+            if line.strip():
+                yield GedcomLine(line, linenum, next_tracker)
+                linenum += 1
+
+
+def read_unparsed(run_args):
+    ''' read_lines() with the error handling of read_gedcom() '''
+    with input_errors(run_args):
+        yield from read_lines(run_args)
+
+
+def split_chunks(lines, rest):
+    ''' Splits the (line number, line) pairs before TRLR to chunks of whole
+        level 0 records. Yields (first line number, list of lines);
+        the TRLR line is stored to rest.
+    '''
+    chunk = []
+    first = 0
+    for linenum, line in lines:
+        if line.lstrip()[:2] == "0 ":
+            if line.split(None, 2)[1] == "TRLR":
+                rest.append((linenum, line))
+                break
+            if len(chunk) >= _JOB_LINES:
+                yield first, chunk
+                chunk = []
+        if not chunk:
+            first = linenum
+        chunk.append(line)
+    if chunk:
+        yield first, chunk
+
+
+_worker = {}    # The transform of a --jobs worker process
+
+def init_worker(modname, run_args):
+    ''' Initializes the transform in a --jobs worker process '''
+    transformer = importlib.import_module(modname)
+    transformer.initialize(run_args)
+    _worker['transformer'] = transformer
+    _worker['run_args'] = run_args
+
+
+def process_chunk(chunk):
+    ''' Runs phase3 for a chunk of lines in a --jobs worker process.
+        Returns the emitted lines and the printed text.
+    '''
+    first, lines = chunk
+    tracker = PathTracker()
+    gedlines = (GedcomLine(line, linenum, tracker)
+                for linenum, line in enumerate(lines, first))
+    sink = LineSink()
+    printed = io.StringIO()
+    with contextlib.redirect_stdout(printed):
+        for _ in run_phase3(_worker['run_args'], _worker['transformer'], gedlines, sink, tracker):
+            pass
+    return sink.take(), printed.getvalue()
+
+
+def run_phase3_parallel(run_args, transformer, gedlines, f, tracker):
+    ''' Runs phase3 of a transform in a pool of run_args['jobs'] processes.
+        The lines before TRLR are given to the workers in chunks of level 0
+        records and the results are written in the original order.
+        TRLR and phase4 are processed here.
+    '''
+    jobs = run_args['jobs']
+    run_args['parallel_phase3'] = True
+    rest = []
+    if gedlines is None:
+        # The workers parse the lines (also with --mmap, as they need the whole lines)
+        lines = read_unparsed(run_args)
+    else:
+        lines = ((gedline.linenum, gedline.line) for gedline in gedlines)
+    # The progress reports and memory statistics are made by this process
+    worker_args = {k: v for k, v in run_args.items()
+                   if k not in ('progress_meter', 'progress_callback', 'memory_stats')}
+    # The modules used only by some of the options are imported when needed,
+    # to keep the start of a short run fast
+    import multiprocessing
+    with multiprocessing.Pool(jobs, initializer=init_worker,
+                              initargs=(transformer.__name__, worker_args)) as pool:
+        pending = collections.deque()
+        for chunk in split_chunks(lines, rest):
+            pending.append(pool.apply_async(process_chunk, (chunk,)))
+            while len(pending) > jobs * 2 or (pending and pending[0].ready()):
+                write_chunk(pending.popleft().get(), f)
+                yield
+        while pending:
+            write_chunk(pending.popleft().get(), f)
+            yield
+    gedlines = (GedcomLine(line, linenum, tracker)
+                for linenum, line in itertools.chain(rest, lines))
+    yield from run_phase3(run_args, transformer, gedlines, f, tracker)
+
+
+def write_chunk(result, f):
+    ''' Writes the result of process_chunk() '''
+    lines, printed = result
+    if printed:
+        sys.stdout.write(printed)
+    f.emit_many(lines)
+
+
+def cacheable(transformer):
+    ''' True, if the phase3 results of the transform can be cached by records '''
+    if hasattr(transformer, "cache_state"):
+        return True
+    return getattr(transformer, "parallel_safe", False) and not hasattr(transformer, "phase1")
+
+
+def run_phase3_incremental(run_args, transformer, gedlines, f, tracker):
+    ''' Runs phase3 only for the records which are not in the cache
+        run_args['incremental']; the others are copied from the cache.
+    '''
+    from transforms.model.transform_cache import TransformCache, cache_key, record_hash
+    if gedlines is None:
+        gedlines = read_gedcom(run_args, tracker)
+    args = {k: v for k, v in run_args.items() if k not in _RUN_OPTIONS}
+    state = transformer.cache_state(run_args) if hasattr(transformer, "cache_state") else ""
+    key = cache_key(transformer, args, state)
+    sink = LineSink()
+    # The input is read one line ahead, see run_phase3_record()
+    record_tracker = PathTracker()
+    after_trlr = False
+    with TransformCache(run_args['incremental'], key) as cache:
+        for record in group_records(gedlines):
+            after_trlr = after_trlr or record.tag == "TRLR"
+            if after_trlr:
+                # phase4 and the end of the file are always processed
+                for _ in run_phase3(run_args, transformer, record.lines, f, tracker):
+                    pass
+                yield
+                continue
+            h = record_hash([gedline.line for gedline in record])
+            result = cache.get(h)
+            if result is None:
+                record_tracker.set(0, record.xref)
+                printed = io.StringIO()
+                with contextlib.redirect_stdout(printed):
+                    for _ in run_phase3(run_args, transformer, record.lines, sink, record_tracker):
+                        pass
+                result = (sink.take(), printed.getvalue())
+                cache.put(h, *result)
+            write_chunk(result, f)
+            yield
+    LOG.info("Välimuistista %s tietuetta, muunnettu %s tietuetta", cache.hits, cache.misses)
+
+
+def phase3_runner(run_args, transformer):
+    ''' Selects the phase3 runner of the last transform '''
+    if run_args.get('incremental'):
+        if not cacheable(transformer):
+            LOG.warning("Muunnos %s ei tue välimuistia, --incremental ohitetaan", transformer.__name__)
+        elif run_args['display_changes']:
+            LOG.warning("--display-changes ei toimi välimuistin kanssa, --incremental ohitetaan")
+        else:
+            return run_phase3_incremental
+    jobs = run_args.get('jobs') or 1
+    if jobs <= 1:
+        return run_phase3
+    if not getattr(transformer, "parallel_safe", False):
+        LOG.warning("Muunnos %s ei tue rinnakkaisajoa, --jobs ohitetaan", transformer.__name__)
+        return run_phase3
+    if run_args['display_changes']:
+        LOG.warning("--display-changes ei toimi rinnakkaisajossa, --jobs ohitetaan")
+        return run_phase3
+    return run_phase3_parallel
+
+
 def process_gedcom(run_args, transformer, task_name=''):
+    ''' Runs a transform or a chain (list) of transforms for the input file.
+        In a chain the output of each transform is passed in memory to the
+        next one and only the last one writes the output file.
+        Returns the seconds used by each phase: a dict with the keys 'initialize',
+        'phase1', 'phase2', 'phase3' and 'total', and the CPU seconds with the
+        keys 'initialize_cpu', ... 'total_cpu'. In a chain the phase3 of a
+        transform runs during the phase1 of the next one, and is counted there.
+        With run_args['profile'] the time used by each callback of the transforms
+        is also logged, see transforms.model.profiler.
+    '''
+    times = collections.Counter()
+    started = time.perf_counter()
+    started_cpu = time.process_time()
 
     LOG.info("------ Ajo '%s'   alkoi %s ------", \
              task_name, \
              datetime.datetime.now().strftime('%a %Y-%m-%d %H:%M:%S'))
 
-    transformer.initialize(run_args)
+    if isinstance(transformer, (list, tuple)):
+        transformers = list(transformer)
+    else:
+        transformers = [transformer]
+    profiler = None
+    if run_args.get('profile') or run_args.get('profile_output'):
+        from transforms.model.profiler import Profiler
+        profiler = Profiler(run_args.get('profile_output'))
+        transformers = [profiler.wrap(t) for t in transformers]
+        profiler.start()
+    if run_args.get('memstats'):
+        from transforms.model.memstats import MemStats
+        run_args['memory_stats'] = MemStats()
+        run_args['memory_stats'].start()
+    if is_stream(run_args['input_gedcom']) and not run_args.get('single_pass'):
+        # The standard input can be read only once
+        run_args['single_pass'] = True
+    for t in transformers:
+        t.initialize(run_args)
+    times['initialize'] = time.perf_counter() - started
+    times['initialize_cpu'] = time.process_time() - started_cpu
+    if run_args.get('progress') or run_args.get('progress_callback'):
+        if not run_args.get('progress'):
+            output = None
+        elif run_args.get('progress_log'):
+            output = "log"
+        else:
+            output = sys.stderr
+        run_args['progress_meter'] = Progress(run_args.get('progress') or _CALLBACK_INTERVAL,
+                                              run_args.get('progress_callback'), output)
+    memory_snapshot(run_args, "alustus")
+    buffers = []
+    default_tracker = GedcomLine.tracker
 
     try:
-        # 1st traverse
-        if hasattr(transformer,"phase1"):
-            for gedline in read_gedcom(run_args):
-                transformer.phase1(run_args, gedline)
-    
-        # Intermediate processing of collected data
-        if hasattr(transformer,"phase2"):
-            transformer.phase2(run_args)
-    
-        do_phase4 = hasattr(transformer,"phase4")
-    
-        # 2nd traverse "phase3"
-        with Output(run_args) as f:
-            f.display_changes = run_args['display_changes']
-            for gedline in read_gedcom(run_args):
-                if do_phase4 and gedline.tag == "TRLR":
-                    f.original_line = ""
-                    transformer.phase4(run_args, f)
-                f.original_line = gedline.line.strip()
-                transformer.phase3(run_args, gedline, f)
-    except FileNotFoundError as err:
+        resolve_encoding(run_args)
+        if run_args.get('index'):
+            # The records of the input file, see transforms.model.gedcom_index
+            from transforms.model.gedcom_index import read_index
+            run_args['gedcom_index'] = read_index(run_args)
+            if run_args['gedcom_index'] is None:
+                LOG.warning("Syötettä '%s' ei voi indeksoida", run_args['input_gedcom'])
+        # Each transform gets the output of the previous one; the phase1 of a
+        # transform is run while the previous transform produces it's output.
+        # In a chain the transforms have run_args of their own, because the
+        # xref table of each one is built from it's own input
+        if len(transformers) > 1:
+            stage_args = [dict(run_args) for t in transformers]
+        else:
+            stage_args = [run_args]
+        gedlines = None
+        tracker = default_tracker
+        write_output = not skips_output(stage_args[-1], transformers[-1])
+        for i, t in enumerate(transformers):
+            if i > 0:
+                if gedlines is None:
+                    gedlines = read_gedcom(run_args, tracker)
+                next_tracker = PathTracker()
+                gedlines = chain_lines(stage_args[i-1], transformers[i-1], gedlines,
+                                       tracker, next_tracker)
+                tracker = next_tracker
+            if i == len(transformers) - 1 and not write_output:
+                run_without_output(stage_args[i], t, gedlines, tracker, times)
+            else:
+                gedlines = prepare_phase3(stage_args[i], t, gedlines, tracker, buffers, times)
+
+        if write_output:
+            # 2nd traverse "phase3" of the last transform
+            start = time.perf_counter()
+            cpu = time.process_time()
+            with Output(run_args) as f:
+                f.display_changes = run_args['display_changes']
+                set_phase(run_args, "phase3", transformers[-1])
+                if profiler:
+                    f.flush = profiler.timed('output', f.flush)
+                runner = phase3_runner(stage_args[-1], transformers[-1])
+                if gedlines is None and runner is not run_phase3_parallel:
+                    gedlines = read_gedcom(run_args, tracker)
+                for _ in runner(stage_args[-1], transformers[-1], gedlines, f, tracker):
+                    pass
+            times['phase3'] = time.perf_counter() - start
+            times['phase3_cpu'] = time.process_time() - cpu
+            memory_snapshot(run_args, "phase3", transformers[-1])
+        for i, t in enumerate(transformers):
+            if hasattr(t, "finalize"):
+                t.finalize(stage_args[i])
+    except (FileNotFoundError, UnicodeDecodeError) as err:
         LOG.error("Ohjelma päättyi virheeseen {}: {}".format(type(err).__name__, str(err)))
-
+    finally:
+        GedcomLine.tracker = default_tracker
+        for replay in buffers:
+            replay.close()
+        run_args.pop('progress_meter', None)
+        run_args.pop('gedcom_index', None)
+        run_args.pop('parallel_phase3', None)
+        if run_args.get('memory_stats'):
+            run_args.pop('memory_stats').stop()
+        if profiler:
+            profile_files = profiler.stop()
+
+    times['total'] = time.perf_counter() - started
+    times['total_cpu'] = time.process_time() - started_cpu
+    LOG.info("Aika: alustus %.2f s, phase1 %.2f s, phase2 %.2f s, phase3 %.2f s, yhteensä %.2f s",
+             times['initialize'], times['phase1'], times['phase2'], times['phase3'], times['total'])
+    if profiler:
+        for name in profile_files:
+            LOG.info("Profiili tiedostoon '%s'", name)
+        for line in profiler.summary(times):
+            LOG.info(line)
     LOG.info("------ Ajo '%s' päättyi %s ------", \
              task_name, \
              datetime.datetime.now().strftime('%a %Y-%m-%d %H:%M:%S'))
+    return dict(times)
 
 
 
+def get_plugins():
+    # all transform modules should be .py files in the package/subdirectory "transforms";
+    # their metadata is read without importing them, see transforms.model.plugin_manifest
+    return get_plugin_manifest("transforms")
+
+
+def import_transform(modname):
+    return importlib.import_module("transforms."+modname)
+
+
 def get_transforms():
-    # all transform modules should be .py files in the package/subdirectory "transforms"
-    for name in os.listdir("transforms"):
-        if name.endswith(".py") and name != "__init__.py": 
-            modname = name[0:-3]
-            transformer = importlib.import_module("transforms."+modname)
-            doc = transformer.__doc__
-            if doc:
-                docline = doc.strip().splitlines()[0]
-            else:
-                docline = ""
-            version = getattr(transformer,"version","")
-            yield (modname,transformer,docline,version)
+    ''' Yields (name, module, docline, version) of each transform; imports all of them '''
+    for plugin in get_plugins():
+        yield (plugin.name, import_transform(plugin.name), plugin.docline, plugin.version)
 
 
 def find_transform(prefix):
+    ''' Imports the transform whose name is or (uniquely) begins with prefix '''
     choices = []
-    for modname, transformer, _docline, _version in get_transforms():
-        if modname == prefix: 
-            return transformer
-        if modname.startswith(prefix):
-            choices.append((modname, transformer))
+    for plugin in get_plugins():
+        if plugin.name == prefix: 
+            return import_transform(plugin.name)
+        if plugin.name.startswith(prefix):
+            choices.append(plugin.name)
     if len(choices) == 1: 
-        return choices[0][1]
+        return import_transform(choices[0])
     if len(choices) > 1: 
         LOG.error("Ambiguous transform name: {}".format(prefix))
-        LOG.error("Matching names: {}".format(",".join(name for name, _ in choices)))
+        LOG.error("Matching names: {}".format(",".join(choices)))
     return False
 
 
@@ -182,11 +810,21 @@ def init_log():
     logging.basicConfig(filename=_LOGFILE,level=logging.INFO, format='%(levelname)s:%(message)s')
 
 
-def main():
+def writes_stdout(run_args):
+    ''' True, if the output GEDCOM is written to the standard output '''
+    if run_args.get('output_gedcom'):
+        return is_stream(run_args['output_gedcom'])
+    return is_stream(run_args['input_gedcom'])
+
+
+def get_parser():
+    ''' The parser of the core options; the transforms add their own options with add_args() '''
     parser = argparse.ArgumentParser()
     parser.add_argument('transform', help="Name of the transform (Python module)")
-    parser.add_argument('input_gedcom', help="Name of the input GEDCOM file")
-    parser.add_argument('--output_gedcom', help="Name of the output GEDCOM file; this file will be created/overwritten" )
+    parser.add_argument('input_gedcom', help="Name of the input GEDCOM file; '-' for stdin, "
+                        "may be compressed with gzip, bzip2, xz or zip")
+    parser.add_argument('--output_gedcom', help="Name of the output GEDCOM file; this file will be created/overwritten; "
+                        "'-' for stdout, compressed if the name ends with .gz, .bz2, .xz or .zip" )
     parser.add_argument('--display-changes', action='store_true',
                         help='Display changed rows')
     parser.add_argument('--dryrun', action='store_true',
@@ -195,15 +833,50 @@ def main():
                         help='Do not produce a log in the output file')
     #parser.add_argument('--display-nonchanges', action='store_true',
     #                    help='Display unchanged places')
-    parser.add_argument('--encoding', type=str, default="utf-8",
-                        help="e.g, UTF-8, ISO8859-1")
+    parser.add_argument('--encoding', type=str, default="auto",
+                        help="e.g, UTF-8, ISO8859-1, ANSEL; the default 'auto' detects it from the input")
+    parser.add_argument('--mmap', action='store_true',
+                        help='Read the input file through a memory map and decode the values only when used')
+    parser.add_argument('--write-buffer', type=int, default=1024,
+                        help="Size of the output buffer in kilobytes")
+    parser.add_argument('--single-pass', action='store_true',
+                        help='Read the input file only once; phase3 replays the lines read in phase1')
+    parser.add_argument('--memory-budget', type=int, default=_MEMORY_BUDGET,
+                        help="Megabytes of lines kept in memory by --single-pass, "
+                             "the rest is stored to a temporary file")
+    parser.add_argument('--index', action='store_true',
+                        help="Create or update the record index file <input>.gedidx and "
+                             "give it to the transforms in run_args['gedcom_index']")
+    parser.add_argument('--incremental', nargs='?', const=_CACHEFILE, metavar='CACHEFILE',
+                        help="Transform only the records changed since the previous run; "
+                             "the results are stored in CACHEFILE (default {})".format(_CACHEFILE))
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="Number of processes for phase3 of a transform declared parallel_safe")
+    parser.add_argument('--profile', action='store_true',
+                        help="Log the time used by each phase and each callback of the transforms")
+    parser.add_argument('--profile-output', metavar='NAME',
+                        help="Also write a cProfile profile to NAME.pstats and the sampled "
+                             "call stacks for a flame graph to NAME.folded; implies --profile")
+    parser.add_argument('--progress', nargs='?', type=float, const=_PROGRESS_INTERVAL, metavar='SECONDS',
+                        help="Report the progress to stderr every SECONDS seconds "
+                             "(default {:.0f})".format(_PROGRESS_INTERVAL))
+    parser.add_argument('--progress-log', action='store_true',
+                        help="Write the progress reports to the log instead of stderr")
+    parser.add_argument('--memstats', action='store_true',
+                        help="Log the memory use, the object counts and the top allocation "
+                             "sites at the end of each phase (slows down the run)")
     parser.add_argument('-l', '--list', action='store_true', help="List transforms")
+    return parser
+
+
+def main():
+    parser = get_parser()
 
     if len(sys.argv) > 1 and sys.argv[1] in ("-l","--list"):
         print("\nTaapeli GEDCOM transform program A (version {})\n".format(_VERSION))
         print("List of transforms:")
-        for modname,transformer,docline,version in get_transforms():
-            print("  {:20.20} {:10.10} {}".format(modname,version,docline))
+        for plugin in get_plugins():
+            print("  {:20.20} {:10.10} {}".format(plugin.name,plugin.version,plugin.docline))
         return
 
     if len(sys.argv) > 1 and sys.argv[1][0] == '-' and sys.argv[1] not in ("-h","--help"):
@@ -212,19 +885,37 @@ def main():
 
     if len(sys.argv) > 1 and sys.argv[1][0] != '-':
         task_name = sys.argv[1]
-        transformer = find_transform(task_name)
-        if not transformer: 
-            print("Transform not found; use -l to list the available transforms")
-            return
-        transformer.add_args(parser)
+        transformers = []
+        for prefix in task_name.split("+"):
+            transformer = find_transform(prefix)
+            if not transformer: 
+                print("Transform not found; use -l to list the available transforms")
+                return
+            if transformer not in transformers:
+                transformer.add_args(parser)
+            transformers.append(transformer)
+        if len(transformers) > 1:
+            if any(t.__name__.endswith(".info") for t in transformers):
+                print("Transform 'info' can not be chained")
+                return
+            transformer = transformers
 
     run_args = vars(parser.parse_args())
 
     if task_name == "info":
         # No file output or log
+        try:
+            resolve_encoding(run_args)
+        except FileNotFoundError:
+            print("Tiedostoa '{}' ei ole!".format(run_args['input_gedcom']))
+            return
         print(transformer.show_info(run_args, transformer, task_name))
     else:
         # Process file
+        if writes_stdout(run_args) or skips_output(run_args, transformers[-1]):
+            # The standard output is reserved for the GEDCOM lines or the report
+            # (written to sys.__stdout__, see open_output())
+            sys.stdout = sys.stderr
         print("Lokitiedot: {!r}".format(_LOGFILE))
         init_log()
         process_gedcom(run_args, transformer, task_name)
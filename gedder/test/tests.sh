@@ -1,25 +1,26 @@
-for f in tests/kasteet-*
+#!/bin/bash
+# Runs the transform of each test file test/<transform>-<n>.ged which has the
+# expected output test/<transform>-<n>.ged.expected and shows the differences.
+# The options of the transform, if any, are in test/<transform>-<n>.ged.options.
+# Each file is run also with --incremental, which uses cache_state().
+cd "$(dirname "$0")/.."
+status=0
+for f in test/*-*.ged
 do
-   python3 gedcom_transform.py kasteet $f --nolog --out x 
-   diff $f.expected x
-done
-
-for f in tests/marriages-*
-do
-   python3 gedcom_transform.py marriages $f --nolog --out x 
-   diff $f.expected x
-done
-
-exit
-
-for f in tests/places-*
-do
-   python3 gedcom_transform.py places $f --nolog --out x 
-   diff $f.expected x
-done
-
-for f in tests/names-*
-do
-   python3 gedcom_transform.py names $f --nolog --out x 
-   diff $f.expected x
+   [ -f $f.expected ] || continue
+   t=$(basename $f)
+   args=""
+   [ -f $f.options ] && args=$(cat $f.options)
+   for options in "" "--incremental x.db"
+   do
+      python3 gedcom_transform.py ${t%%-*} $f --nolog --out x $args $options > /dev/null 2>&1
+      if ! diff $f.expected x
+      then
+         echo "FAILED: $f $args $options"
+         status=1
+      fi
+      rm -f x x.db
+   done
 done
+rm -f transform.log transform.log~
+exit $status
@@ -7,9 +7,12 @@ Hiski-lähdeviitteiden tulkinta (?)
 #import collections
 import urllib.request
 
+from transforms.model.gedcom_path import PathPattern
+
+_SOUR = PathPattern("*.**.SOUR")
+
 version = "1.0"
 
-sourceids = set()  # set of sources ids (@Sxxxx@) to be processed
 maxnotenum = 0
 notes = []        # list of (notenum,link)
 
@@ -101,17 +104,15 @@ def initialize(run_args):
 def phase1(run_args, gedline):
     global maxnotenum
      
-    # The following two if statements process the GEDCOM lines like
+    # The following if statement processes the GEDCOM lines like
     #   0 @S0000@ SOUR
     #   1 TITL http://hiski.genealogia.fi/...
-    # and store the citations in 'citations'
-    if gedline.value == "SOUR" and gedline.level == 0: # 0 @Sxxxx@ SOUR
-        sourceids.add(gedline.tag)  
+    # and stores the citations in 'citations'
     if (gedline.tag == "TITL" and
         gedline.level == 1 and  
         gedline.value.startswith("http://hiski.genealogia.fi/")):
-        sourceid = gedline.path.split(".")[0]
-        if sourceid in sourceids:
+        sourceid = gedline.xref
+        if run_args['xref_table'].type(sourceid) == "SOUR":
             link = gedline.value
             srk,kirja = get_hiski_info(link)
             sourcename = "HisKi %s %s" % (srk,kirja)
@@ -119,17 +120,22 @@ def phase1(run_args, gedline):
             citations.add(sourceid,sourcename,reponame,link)
         
     if 0 and gedline.path.endswith(".NOTE"):
-        noteid = gedline.path.split(".")[0]  # @Nxxxx@
+        noteid = gedline.xref  # @Nxxxx@
         n = int(noteid[1:-1])
         if n >= maxnotenum: maxnotenum = n
 
 def phase2(run_args):
     pass
 
+def cache_state(run_args):
+    # The new source numbers used by phase3, for the --incremental cache
+    return repr(sorted((sour, source.num, link) for sour, (source, link)
+                       in citations.original_sour_to_source.items()))
+
 def phase3(run_args, gedline, f):
     global maxnotenum
-    indi_id = gedline.path.split(".")[0]
-    if gedline.path.endswith(".SOUR"):  # n SOUR @Sxxxx@ 
+    indi_id = gedline.xref
+    if _SOUR.match(gedline):  # n SOUR @Sxxxx@ 
         #indi = gedline.path.split(".")[0]
         sour = gedline.value
         if sour in citations.original_sour_to_source:
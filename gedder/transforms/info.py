@@ -7,6 +7,9 @@ Created on 23.4.2017
 from re import match
 from collections import OrderedDict
 
+from transforms.model.gedcom_io import open_input
+from transforms.model.gedcom_index import get_index
+
 version = "1.0"
 
 def add_args(parser):
@@ -22,7 +25,7 @@ def show_info(run_args, transformer, task_name=''):
     cnt = {}
     #msg.append(os.path.basename(input_gedcom) + '\n')
     try:
-        with open(input_gedcom, 'r', encoding=enc) as f:
+        with open_input(input_gedcom, enc) as f:
             for _ in range(100):
                 ln = f.readline()
                 if ln[:6] in ['2 VERS', '1 NAME', '1 CHAR']:
@@ -41,7 +44,22 @@ def show_info(run_args, transformer, task_name=''):
                 if match('0.*INDI', ln):
                     cnt['INDI'] = 1
                     break
-            ln = '-'
+            index = None
+            if run_args.get('index') and cnt:
+                index = get_index(input_gedcom, enc)
+            if index:
+                # Count the records after the first INDI from the index
+                counting = False
+                for _offset, _length, rtype, _xref in index.entries:
+                    if counting:
+                        key = rtype[:4]
+                        if key in cnt:
+                            cnt[key] = cnt[key] + 1
+                        elif key != 'TRLR':
+                            cnt[key] = 1
+                    elif rtype == 'INDI':
+                        counting = True
+            ln = '-' if index is None else ''
             while ln:
                 ln = f.readline()[:-1]
                 if ln.startswith('0'):
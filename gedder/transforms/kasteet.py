@@ -28,8 +28,11 @@ Pekka
 """
 
 version = "1.0"
+parallel_safe = True    # phase3 does not depend on other records
 
-ids = set()
+from transforms.model.gedcom_path import PathPattern
+
+_BIRT_PLAC = PathPattern("*.BIRT.PLAC")
 
 def add_args(parser):
     parser.add_argument("--testiparametri")
@@ -37,23 +40,12 @@ def add_args(parser):
 def initialize(run_args):
     pass
 
-def phase1(run_args, gedline):
-    if gedline.path.endswith(".BIRT.PLAC") and gedline.value.startswith("(kastettu)"):
-        # @id@.BIRT.PLACE (kastettu) xxx
-        parts = gedline.path.split(".")
-        indi_id = parts[0]
-        ids.add(indi_id)
-
-def phase2(run_args):
-    pass
-
-def phase3(run_args, gedline,f):
-    parts = gedline.path.split(".")
-    indi_id = parts[0]
-    if indi_id in ids:
-        if gedline.tag == "BIRT": gedline.tag = "CHR"
-        if gedline.tag == "PLAC" and gedline.value.startswith("(kastettu)"): 
-            gedline.value = " ".join(gedline.value.split()[1:])
-    gedline.emit(f)
-
-
+def phase3_record(run_args, record, f):
+    # @id@.BIRT.PLACE (kastettu) xxx
+    if any(_BIRT_PLAC.match(gedline) and gedline.value.startswith("(kastettu)")
+           for gedline in record):
+        for gedline in record:
+            if gedline.tag == "BIRT": gedline.tag = "CHR"
+            if gedline.tag == "PLAC" and gedline.value.startswith("(kastettu)"): 
+                gedline.value = " ".join(gedline.value.split()[1:])
+    record.emit(f)
@@ -19,21 +19,23 @@ Ohjelman perusteet:
             
 Ohjelman toiminta:
 
-- Phase 1   Gedcom-aineisto käydään läpi ja kerätään lähteen tunnuskohtaisesti 
-            (@Snnnn@) rivinumerot, jotka viittaavat lähteeseen.
+- Phase 1   Gedcom-aineisto käydään läpi. Lähteeseen viittaavien 
+            SOUR-rivien tasot talletetaan rivinumeroittain.
             Kunkin lähde-elementin TITLE-rivistä jäsennellään puolipistein 
             erotetut osat, joiden kunkin tulkitaan kuvaavan yhtä lähdettä 
-            ja mahdollista viittausta siihen. Jos osasta löytyy sivunumeroon 
-            viittaus, se lisätään lähdeviittausrivin jälkeiseksi PAGE-riviksi 
-            insertions-dictionaryyn.
+            ja mahdollista viittausta siihen.
             Lähdemäärittelyn alkuperäisen Title-rivin ensimmäisestä osasta 
             muodostetaan sivunumeroton Title-rivi, joka lisätään Title-riviksi 
             replaces-dictionaryyn.
-            Mahdollisten muiden osien sisällöistä muodostetaan SOUR- ja 
-            TITL-rivit alkuperäisen lähteen NOTE-osan jälkeen lisättäviksi 
-            insertions-dictionaryyn.
             
-- Phase 2   Ei toimintaa
+- Phase 2   Lähteeseen (@Snnnn@) viittaavien rivien numerot saadaan 
+            run_args['xref_table']-taulusta. Jos Title-rivin osasta löytyi 
+            sivunumeroon viittaus, se lisätään kunkin lähdeviittausrivin 
+            jälkeiseksi PAGE-riviksi (viittausrivin tasoa seuraavalle tasolle) 
+            insertions-dictionaryyn.
+            Mahdollisten muiden osien sisällöistä muodostetaan uudet SOUR-, 
+            TITL- ja NOTE-rivit alkuperäisen lähteen viimeisen rivin jälkeen 
+            lisättäviksi insertions-dictionaryyn.
 
 - Phase 3   Gedcom-aineisto käydään läpi ja jos rivinumero on avaimena jossain 
             dictionaryista, suoritetaan arvo-osassa korvaukset ja/tai lisäykset
@@ -47,14 +49,18 @@ version = "0.9"
 import re
 import logging
 LOG = logging.getLogger(__name__)
+
+from transforms.model.gedcom_path import PathPattern
+
+_SOUR = PathPattern("*.**.SOUR")
+_SOUR_TITL = PathPattern("@S*.**.TITL")
+_SOUR_NOTE = PathPattern("@S*.**.NOTE")
 LOG.setLevel(logging.DEBUG)
 
 intag = False
 linenumber = 0
 xsourcenumber = 1000  
-references = {}
 spointer = ''
-slevel = 0
 ttext = ''
 ntext = ''                 
 
@@ -63,8 +69,20 @@ ntext = ''
 def add_args(parser):
     pass
 
+def source_references(run_args, pointer):
+    ''' The line numbers of the SOUR lines referring to the source '''
+    return [linenum for _xref, _tag, linenum 
+            in run_args['xref_table'].referrers(pointer, 'SOUR')]
+
 def initialize(run_args):
-    pass
+    global xsourcenumber
+    global spointer
+    global ttext
+    xsourcenumber = 1000
+    spointer = ''
+    ttext = ''
+    for table in (insertions, replaces, deletes, source_levels, titles):
+        table.clear()
 
 regexb = "^([A-ZÅÄÖa-zåäö., ]*)(RK|LK|vihityt|syntyneet|pääkirja|F/D)\s*(1[0-9]{3})-([0-9]{0,4})\s*([A-ZÅÄÖa-zåäö,]*)\s*(sivu |s\. |s\.|s |s|p |p\. |p\.|pg\. |pg\.|pg |pg)([0-9]{1,4})*(.*)"        
 #regexb = "^([A-ZÅÄÖa-zåäö, ]*)(RK|LK|vihityt|syntyneet|pääkirja|F/D)\s*(1[0-9]{3})-([0-9]{0,4}) ([A-ZÅÄÖa-zåäö, ]*)(s|s |s\.|s\. |p|p |p\.|p\. |pg |pg\.|pg\. )([0-9]{1,4})*([A-ZÅÄÖa-zåäö0-9!',/: ]*)"        
@@ -72,6 +90,8 @@ regexb = "^([A-ZÅÄÖa-zåäö., ]*)(RK|LK|vihityt|syntyneet|pääkirja|F/D)\s*
 insertions = {}
 replaces = {}
 deletes = {}
+source_levels = {}      # line number of a SOUR pointer line: its level
+titles = []             # (source xref, textouts, citations) of the TITL lines
 
 def parseText(textpart):
 #    regexa = "^(.+);?\s?(.+);?"
@@ -120,37 +140,23 @@ def parseText(textpart):
 def phase1(run_args, gedline):
 #    for element in element_list: (gedline)
     global linenumber
-    global insertions
-    global replaces
-    global deletes 
     global ttext
     global spointer
-    global slevel
-    global xsourcenumber
-    path = gedline.path
     value = gedline.value
-#    linenumber = gedline.1inenum
-    if path.startswith('HEAD'):
+    linenumber = gedline.linenum
+    if gedline.xref.startswith('HEAD'):
         return
-    elif gedline.level > 0 and path.endswith('.SOUR'):    # SOUR referenced by an element
-        pointer = gedline.value
-        slevel = gedline.level
-        if pointer in references:
-            references[pointer].append(linenumber)
-        else:    
-            references[pointer] = [linenumber]
-#            insertions[linenumber] = [pointer]
+    elif _SOUR.match(gedline):    # SOUR referenced by an element
+        source_levels[linenumber] = gedline.level
     elif gedline.level == 0 and value == 'SOUR':
-        spointer = gedline.path 
-        print("    New SOUR declaration {}, referenced by {}".\
-              format(gedline.line, references[spointer]))
+        spointer = gedline.xref 
+        print("    New SOUR declaration {}".format(gedline.line))
                            
-    elif path.startswith('@S') and path.endswith('.TITL'):
+    elif _SOUR_TITL.match(gedline):
         if gedline.value == ttext:
-            LOG.debug("    Tuplan poisto", ttext)
+            LOG.debug("    Tuplan poisto %s", ttext)
             deletes[linenumber] = ttext
         ttext = gedline.value
-        referrers = references[spointer]
         result = parseText(ttext)
         textouts = result[0]
         citations = result[1]
@@ -158,48 +164,49 @@ def phase1(run_args, gedline):
         if textouts:
             replaces[linenumber] = str(gedline.level) + ' ' + gedline.tag \
             + ' ' + gedline.value + ' ' + textouts[0]
-        if citations:
-            for ind in range(0, len(referrers)):
-                citation = "{} PAGE ".format(str(slevel + 1)) + citations[0]
-                insertions[referrers[ind]] = [citation]
-                print("    Insert lines after {} {}".\
-                      format(referrers[ind], insertions[referrers[ind]]))    
-        if len(textouts) > 1:
-            insertions[linenumber+1] = []
-            for ind in range(1, len(textouts)):
-                xsourcenumber +=1
-                sline = '0  @S{}@ SOUR'.format(xsourcenumber)
-                insertions[linenumber+1].append(sline)
-                tline = '1 TITL  ' + textouts[ind]
-                insertions[linenumber+1].append(tline)
-                insertions[linenumber+1].append('1 NOTE  ' + textouts[ind])
-                print("    Insert lines after {} {}".\
-                      format(linenumber+1, insertions[linenumber+1]))
+            titles.append((spointer, textouts, citations))
 #            ttext = '' 
  
-    elif path.startswith('@S') and path.endswith('.NOTE'):
+    elif _SOUR_NOTE.match(gedline):
         ntext = gedline.value
         if ttext != ntext:
             print("-NOTE ", ntext, " ", spointer)
             ntextout, ncitations = parseText(ntext)
             print("    -NOTE ", ntext, " ", ntextout, " ", ncitations, spointer)
         ttext = ''
-        ntext = ''
         
     else:
-#        spointer = ''
-        slevel = 0
         ttext = ''
-        ntext = ''    
 
 #                
-# Phase 2: None
+# Phase 2: Insert the citations and the new sources
 #
 
 def phase2(run_args):
-    global linenumber
-    linenumber = 0
-    print(references)    
+    global xsourcenumber
+    table = run_args['xref_table']
+    for pointer, textouts, citations in titles:
+        referrers = source_references(run_args, pointer)
+        print("    SOUR {} referenced by {}".format(pointer, referrers))
+        if citations:
+            for referrer in referrers:
+                citation = "{} PAGE {}".format(source_levels[referrer] + 1, 
+                                               citations[0])
+                insertions.setdefault(referrer, []).append(citation)
+                print("    Insert lines after {} {}".\
+                      format(referrer, insertions[referrer]))    
+        if len(textouts) > 1:
+            # The new records follow the last line of the original source
+            _first, last = table.lines(pointer)
+            for ind in range(1, len(textouts)):
+                xsourcenumber +=1
+                while '@S{}@'.format(xsourcenumber) in table:
+                    xsourcenumber +=1
+                lines = insertions.setdefault(last, [])
+                lines.append('0 @S{}@ SOUR'.format(xsourcenumber))
+                lines.append('1 TITL ' + textouts[ind])
+                lines.append('1 NOTE ' + textouts[ind])
+                print("    Insert lines after {} {}".format(last, lines))
 
 #                
 # Phase 3: Build the resulting GEDCOM 
@@ -213,20 +220,17 @@ def phase3(run_args, gedline, f):
 #     linenumber = 0
 #     for element in element_list:
     global linenumber
-    global insertions
-    global replaces
-    global deletes 
     line = gedline.line
-    linenumber += 1
-    if linenumber in deletes:
-        return
+    linenumber = gedline.linenum
     #=======================================================================
     # element_out = str(gedline.level) + ' ' + gedline.tag + ' '
     # if element.pointer() != '':
     #     element_out = element_out + element.pointer() + ' '
     # element_out = element_out + gedline.value
     #=======================================================================
-    if linenumber in replaces:
+    if linenumber in deletes:
+        pass
+    elif linenumber in replaces:
         f.emit(replaces[linenumber])
     else: 
         f.emit(line)
@@ -45,9 +45,12 @@ from collections import defaultdict
 import re
 #from PIL.SpiderImagePlugin import outfile
 
+from transforms.model.gedcom_path import PathPattern
+
+_MARR_DATE = PathPattern("*.MARR.DATE")
+_MARR_PLAC = PathPattern("*.MARR.PLAC")
+
 class FamInfo:
-    husb = None
-    wife = None
     date = None
     place = ""
    
@@ -70,45 +73,39 @@ def initialize(run_args):
 
 def phase1(run_args, gedline):
     '''
-		1st traverse: finding all families
+		1st traverse: finding the marriage dates and places;
+		the spouses are found from run_args['xref_table']
     '''
-    path = gedline.path
-    value = gedline.value
-    
-    if path.endswith(".HUSB"):  # @fam@.HUSB @husb@
-        parts = path.split(".")
-        fam = parts[0]
-        #husbands[fam] = value
-        fams[fam].husb = value
-    if path.endswith(".WIFE"):  # @fam@.WIFE @wife@
-        parts = path.split(".")
-        fam = parts[0]
-        #wives[fam] = value
-        fams[fam].wife = value
-    if path.endswith(".MARR.DATE"):  # @fam@.MARR.DATE date
-        parts = path.split(".")
-        fam = parts[0]
-        #dates[fam] = value
-        fams[fam].date = value
-    if path.endswith(".MARR.PLAC"):  # @fam@.MARR.PLAC place
-        parts = path.split(".")
-        fam = parts[0]
-        #place = value
-        fams[fam].place = value
+    if _MARR_DATE.match(gedline):  # @fam@.MARR.DATE date
+        fams[gedline.xref].date = gedline.value
+    elif _MARR_PLAC.match(gedline):  # @fam@.MARR.PLAC place
+        fams[gedline.xref].place = gedline.value
 
 def phase2(run_args):
     '''
         Parse multiple places mentioned as marriage location: "loc1, (loc2, loc3)"
     '''
+    table = run_args['xref_table']
     for fam,faminfo in fams.items():
         m = re.match(r"([^,]+), \(([^/]+)/([^/]+)\)",faminfo.place)
         if m:
             husb_place = m.group(2)+", "+m.group(1)
             wife_place = m.group(3)+", "+m.group(1)
-            resi[faminfo.husb].append((husb_place,faminfo.date))
-            resi[faminfo.wife].append((wife_place,faminfo.date))
+            husb = table.target(fam, "HUSB")
+            wife = table.target(fam, "WIFE")
+            # A family may lack the husband or the wife
+            if husb:
+                resi[husb].append((husb_place,faminfo.date))
+            if wife:
+                resi[wife].append((wife_place,faminfo.date))
             fixedfams[fam] = m.group(1)
 
+def cache_state(run_args):
+    '''
+        The collected data used by phase3, for the --incremental cache
+    '''
+    return repr((sorted(resi.items()), sorted(fixedfams.items())))
+
 def phase3(run_args, gedline, f):
     '''
         2nd traverse: creating the new GEDCOM file
@@ -123,9 +120,8 @@ def phase3(run_args, gedline, f):
                 if date: f.emit("2 DATE " + date)
                 f.emit("2 PLAC " + place)
             return
-    if gedline.path.endswith(".MARR.PLAC"):  # @fam@.MARR.PLAC place
-        parts = gedline.path.split(".")
-        fam = parts[0]
+    if _MARR_PLAC.match(gedline):  # @fam@.MARR.PLAC place
+        fam = gedline.xref
         if fam in fixedfams:
             gedline.tag = "PLAC"
             gedline.value = fixedfams[fam]
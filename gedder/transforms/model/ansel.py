@@ -0,0 +1,240 @@
+'''
+ANSEL (ANSI Z39.47) codec for GEDCOM files.
+
+The codec is registered with the name "ansel" when this module is imported:
+    import transforms.model.ansel
+    open(name, encoding="ansel")
+
+The bytes 0x00-0x7F are ASCII and 0xA1-0xCF are special letters and signs.
+The bytes 0xE0-0xFE are combining diacritics, which in ANSEL precede the
+letter they modify ("\\xe8a" = "ä"), while in Unicode they follow it.
+When decoding, the diacritics are moved after their letter and the result
+is normalized to the composed form (NFC); when encoding, the text is
+decomposed (NFD) and the diacritics are moved before their letter.
+
+The bytes are mapped with charmap tables, so a block of text is decoded or
+encoded with one C level call; the tables (and the regular expressions)
+are built when the codec is first used. The letters with diacritics
+are composed with a cache of the sequences seen; the encoding table maps
+them directly to the diacritics and the letter.
+'''
+
+import re
+import codecs
+import unicodedata
+
+# The special characters
+_SPECIAL = {
+    0xA1: "\u0141",    # Ł
+    0xA2: "\u00D8",    # Ø
+    0xA3: "\u0110",    # Đ
+    0xA4: "\u00DE",    # Þ
+    0xA5: "\u00C6",    # Æ
+    0xA6: "\u0152",    # Œ
+    0xA7: "\u02B9",    # ʹ
+    0xA8: "\u00B7",    # ·
+    0xA9: "\u266D",    # ♭
+    0xAA: "\u00AE",    # ®
+    0xAB: "\u00B1",    # ±
+    0xAC: "\u01A0",    # Ơ
+    0xAD: "\u01AF",    # Ư
+    0xAE: "\u02BC",    # ʼ
+    0xB0: "\u02BB",    # ʻ
+    0xB1: "\u0142",    # ł
+    0xB2: "\u00F8",    # ø
+    0xB3: "\u0111",    # đ
+    0xB4: "\u00FE",    # þ
+    0xB5: "\u00E6",    # æ
+    0xB6: "\u0153",    # œ
+    0xB7: "\u02BA",    # ʺ
+    0xB8: "\u0131",    # ı
+    0xB9: "\u00A3",    # £
+    0xBA: "\u00F0",    # ð
+    0xBC: "\u01A1",    # ơ
+    0xBD: "\u01B0",    # ư
+    0xC0: "\u00B0",    # °
+    0xC1: "\u2113",    # ℓ
+    0xC2: "\u2117",    # ℗
+    0xC3: "\u00A9",    # ©
+    0xC4: "\u266F",    # ♯
+    0xC5: "\u00BF",    # ¿
+    0xC6: "\u00A1",    # ¡
+    0xC7: "\u00DF",    # ß (MARC)
+    0xC8: "\u20AC",    # €
+    0xCF: "\u00DF",    # ß (GEDCOM)
+}
+
+# The combining diacritics, written before the letter
+_COMBINING = {
+    0xE0: "\u0309",    # hook above
+    0xE1: "\u0300",    # grave
+    0xE2: "\u0301",    # acute
+    0xE3: "\u0302",    # circumflex
+    0xE4: "\u0303",    # tilde
+    0xE5: "\u0304",    # macron
+    0xE6: "\u0306",    # breve
+    0xE7: "\u0307",    # dot above
+    0xE8: "\u0308",    # diaeresis
+    0xE9: "\u030C",    # caron
+    0xEA: "\u030A",    # ring above
+    0xEB: "\uFE20",    # ligature, left half
+    0xEC: "\uFE21",    # ligature, right half
+    0xED: "\u0315",    # comma above right
+    0xEE: "\u030B",    # double acute
+    0xEF: "\u0310",    # candrabindu
+    0xF0: "\u0327",    # cedilla
+    0xF1: "\u0328",    # ogonek
+    0xF2: "\u0323",    # dot below
+    0xF3: "\u0324",    # diaeresis below
+    0xF4: "\u0325",    # ring below
+    0xF5: "\u0333",    # double low line
+    0xF6: "\u0332",    # low line
+    0xF7: "\u0326",    # comma below
+    0xF8: "\u031C",    # left half ring below
+    0xF9: "\u032E",    # breve below
+    0xFA: "\uFE22",    # double tilde, left half
+    0xFB: "\uFE23",    # double tilde, right half
+    0xFE: "\u0313",    # comma above
+}
+
+def _decoding_table():
+    table = [chr(i) for i in range(0x80)] + ["\ufffe"] * 0x80
+    for code, char in list(_SPECIAL.items()) + list(_COMBINING.items()):
+        table[code] = char
+    return "".join(table)
+
+def _encoding_table():
+    table = {i: i for i in range(0x80)}
+    for code, char in list(_SPECIAL.items()) + list(_COMBINING.items()):
+        table[ord(char)] = code
+    # ß is written in the GEDCOM way
+    table[0xDF] = 0xCF
+    # The composed letters are written as diacritics + letter
+    for code in range(0x80, 0x2000):
+        nfd = unicodedata.normalize("NFD", chr(code))
+        if len(nfd) > 1 and all(ord(c) in table for c in nfd):
+            table[code] = bytes(table[ord(c)] for c in nfd[1:] + nfd[0])
+    return table
+
+# The charmap tables and the regular expressions, set by _build_tables()
+_decoding = ""
+_encoding = {}
+_MARK_BYTES = _ANSEL_ORDER = _UNICODE_ORDER = _UNICODE_MARK = None
+
+def _build_tables():
+    global _decoding, _encoding, _MARK_BYTES, _ANSEL_ORDER, _UNICODE_ORDER, _UNICODE_MARK
+    marks = "".join(sorted(_COMBINING.values()))
+    _MARK_BYTES = re.compile(b"[\xe0-\xfe]")
+    # Diacritics before a letter (ANSEL order) and after it (Unicode order);
+    # a diacritic is never moved over a line break
+    _ANSEL_ORDER = re.compile("([{0}]+)([^{0}\r\n])".format(marks))
+    _UNICODE_ORDER = re.compile("([^{0}\r\n])([{0}]+)".format(marks))
+    _UNICODE_MARK = re.compile("[{0}]".format(marks))
+    _decoding = _decoding_table()
+    _encoding = _encoding_table()
+
+_composed = {}      # diacritics + letter in ANSEL order -> composed text
+
+def _compose(match):
+    seq = match.group(0)
+    text = _composed.get(seq)
+    if text is None:
+        text = unicodedata.normalize("NFC", match.group(2) + match.group(1))
+        _composed[seq] = text
+    return text
+
+
+def decode(data, errors='strict'):
+    ''' Decodes ANSEL bytes; returns (text, number of bytes used) '''
+    if not _decoding:
+        _build_tables()
+    text, length = codecs.charmap_decode(data, errors, _decoding)
+    if _MARK_BYTES.search(data):
+        text = _ANSEL_ORDER.sub(_compose, text)
+    return text, length
+
+
+def encode(text, errors='strict'):
+    ''' Encodes text to ANSEL; returns (bytes, number of characters used) '''
+    length = len(text)
+    if not _encoding:
+        _build_tables()
+    if not text.isascii():
+        if _UNICODE_MARK.search(text):
+            # Decomposed text: move the diacritics before their letters
+            text = unicodedata.normalize("NFD", text)
+            text = _UNICODE_ORDER.sub(r"\2\1", text)
+    data, _length = codecs.charmap_encode(text, errors, _encoding)
+    return data, length
+
+
+class IncrementalDecoder(codecs.BufferedIncrementalDecoder):
+    ''' Keeps the diacritics at the end of a block until their letter comes '''
+
+    def _buffer_decode(self, data, errors, final):
+        end = len(data)
+        if not final:
+            while end > 0 and 0xE0 <= data[end - 1] <= 0xFE:
+                end -= 1
+        text, length = decode(data[:end], errors)
+        return text, length
+
+
+class IncrementalEncoder(codecs.IncrementalEncoder):
+    ''' Keeps the last letter of a block until its diacritics are known '''
+
+    def __init__(self, errors='strict'):
+        codecs.IncrementalEncoder.__init__(self, errors)
+        self.pending = ""
+
+    def encode(self, text, final=False):
+        text = self.pending + text
+        self.pending = ""
+        if not final and text and text[-1] != "\n":
+            # Keep the last letter and its diacritics; a block ending
+            # with a new line (as the lines written by Output) is complete
+            if not _encoding:
+                _build_tables()
+            end = len(text) - 1
+            while end > 0 and _UNICODE_MARK.match(text[end]):
+                end -= 1
+            self.pending = text[end:]
+            text = text[:end]
+        return encode(text, self.errors)[0]
+
+    def reset(self):
+        self.pending = ""
+
+    def getstate(self):
+        return 1 if self.pending else 0
+
+
+class StreamReader(codecs.StreamReader):
+    def decode(self, data, errors='strict'):
+        return decode(data, errors)
+
+
+class StreamWriter(codecs.StreamWriter):
+    def encode(self, text, errors='strict'):
+        return encode(text, errors)
+
+
+_CODEC_INFO = codecs.CodecInfo(
+    name="ansel",
+    encode=encode,
+    decode=decode,
+    incrementalencoder=IncrementalEncoder,
+    incrementaldecoder=IncrementalDecoder,
+    streamreader=StreamReader,
+    streamwriter=StreamWriter,
+)
+
+
+def search(name):
+    ''' Codec search function for codecs.register() '''
+    if name in ("ansel", "ansi_z39_47", "z39_47"):
+        return _CODEC_INFO
+    return None
+
+
+codecs.register(search)
@@ -0,0 +1,92 @@
+'''
+Fuzzy lookup of words with typos.
+
+The index maps each trigram of the words (padded with "$" at both ends) to
+the words containing it. A query looks up the words sharing trigrams with
+it; a word within the edit distance k of the query shares at least
+n - 4 * k of the n distinct trigrams of the query, as each edit changes at
+most four trigrams. The candidates passing this and the length filter are
+verified with the edit distance (Levenshtein distance, where also a swap of
+two adjacent letters is one edit), which is computed only up to the limit.
+
+Usage:
+    index = FuzzyIndex(["pielavesi", "kuopio"])
+    index.best("pielavsi", 1)          # ('pielavesi', 1)
+'''
+
+import collections
+
+
+def trigrams(word):
+    ''' The distinct trigrams of the padded word '''
+    padded = "$$" + word + "$$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    ''' The edit distance of a and b, or limit + 1 if it is larger than limit '''
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before = None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            d = min(previous[j] + 1,                    # deletion
+                    current[j - 1] + 1,                 # insertion
+                    previous[j - 1] + (ca != cb))       # substitution
+            if before is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                d = min(d, before[j - 2] + 1)           # swap
+            current.append(d)
+        if min(current) > limit:
+            return limit + 1
+        before = previous
+        previous = current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+
+class FuzzyIndex(object):
+    ''' Trigram index of a set of words '''
+
+    def __init__(self, words):
+        self.words = sorted(set(words))
+        self.postings = collections.defaultdict(list)   # trigram -> word numbers
+        for num, word in enumerate(self.words):
+            for gram in trigrams(word):
+                self.postings[gram].append(num)
+
+    def __len__(self):
+        return len(self.words)
+
+    def candidates(self, word, max_distance):
+        ''' The numbers of the words which may be within max_distance of word '''
+        grams = trigrams(word)
+        need = len(grams) - 4 * max_distance
+        if need <= 0:
+            # Too short a word for the trigram filter
+            return range(len(self.words))
+        counts = collections.Counter()
+        for gram in grams:
+            counts.update(self.postings.get(gram, ()))
+        return [num for num, count in counts.items() if count >= need]
+
+    def best(self, word, max_distance=1):
+        '''
+        Returns (the nearest word, distance) or None, if there is no word within
+        max_distance or if several words are equally near.
+        '''
+        best = None
+        best_distance = max_distance
+        ambiguous = False
+        for num in self.candidates(word, max_distance):
+            candidate = self.words[num]
+            distance = edit_distance(word, candidate, best_distance)
+            if distance < best_distance or (distance == best_distance and best is None):
+                best = candidate
+                best_distance = distance
+                ambiguous = False
+            elif distance == best_distance:
+                ambiguous = True
+        if best is None or ambiguous:
+            return None
+        return best, best_distance
@@ -0,0 +1,69 @@
+'''
+Binary snapshot of the place lists read from text files.
+
+The parish and village lists of the places transform are parsed from the
+text files in "static" only when they have changed. The parsed data is
+stored with pickle to a snapshot file together with the modification times
+and sizes of the source files and a version string of the parser; when any
+of them differs, the data is parsed again and the snapshot is rewritten.
+If the snapshot can't be written, the files are parsed on each run.
+
+Usage:
+    parishes, villages = load_snapshot("static/gazetteer.snapshot",
+                                       ["static/seurakunnat.txt", "static/kylat.txt"],
+                                       read_gazetteer, version="1")
+'''
+
+import os
+import pickle
+import logging
+LOG = logging.getLogger(__name__)
+
+_FORMAT = 1             # Version of the snapshot file
+
+
+def source_stamps(sources):
+    ''' The names, modification times and sizes of the source files '''
+    stamps = []
+    for name in sources:
+        st = os.stat(name)
+        stamps.append((name, st.st_mtime_ns, st.st_size))
+    return stamps
+
+
+def read_snapshot(snapshot, stamps, version):
+    ''' The data of the snapshot or None, if it is missing or out of date '''
+    try:
+        with open(snapshot, "rb") as f:
+            header = pickle.load(f)
+            if header != (_FORMAT, version, stamps):
+                return None
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError, AttributeError):
+        return None
+
+
+def write_snapshot(snapshot, stamps, version, data):
+    tmpname = snapshot + ".tmp"
+    try:
+        with open(tmpname, "wb") as f:
+            pickle.dump((_FORMAT, version, stamps), f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpname, snapshot)
+    except OSError as err:
+        LOG.debug("Tiedostoa '%s' ei voitu tallentaa: %s", snapshot, err)
+
+
+def load_snapshot(snapshot, sources, build, version=""):
+    '''
+    Returns the data built by build(*sources) from the source files.
+    The data is read from the snapshot file, if it is up to date; otherwise
+    it is built and saved to the snapshot. The version should be changed
+    when build() is changed.
+    '''
+    stamps = source_stamps(sources)
+    data = read_snapshot(snapshot, stamps, version)
+    if data is None:
+        data = build(*sources)
+        write_snapshot(snapshot, stamps, version, data)
+    return data
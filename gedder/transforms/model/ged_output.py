@@ -7,11 +7,24 @@ import sys
 import os
 import getpass
 import time
-import tempfile
 import logging
 LOG = logging.getLogger(__name__)
 
+from transforms.model.gedcom_io import open_output, is_stream, sniff_compression, \
+    archive_member_name, STREAM
+
+_BUFFER_SIZE = 1024     # Default size of the write buffer in kilobytes
+_BATCH_LINES = 4096     # Number of lines collected before writing them
+
 class Output:
+    '''
+    The output GEDCOM file.
+
+    The lines given to emit() or emit_many() are collected to batches which are
+    written with one write call. The transform log note and the display of the
+    changes are handled only for the first line or when display_changes is set;
+    after the first line emit() is replaced by a method without these checks.
+    '''
     def __init__(self, run_args):
         self.run_args = run_args
         if 'nolog' in self.run_args and run_args['nolog']: 
@@ -34,55 +47,122 @@ class Output:
             self.out_name = self.run_args['output_gedcom']
         else:
             self.out_name = None
+        if 'write_buffer' in self.run_args and self.run_args['write_buffer']:
+            self.buffer_size = self.run_args['write_buffer'] * 1024
+        else:
+            self.buffer_size = _BUFFER_SIZE * 1024
         self.new_name = None
+        self.original_line = ""
+        self.pending = []
 
     def __enter__(self):
+        if not self.out_name and is_stream(self.in_name):
+            # From stdin to stdout
+            self.out_name = STREAM
         if self.out_name:
-            self.f = open(self.out_name, "w", encoding=self.encoding)
+            self.f = open_output(self.out_name, self.encoding, self.buffer_size)
         else:
+            import tempfile
             # create tempfile in the same directory so you can rename it later
             tempfile.tempdir = os.path.dirname(self.in_name) 
             self.temp_name = tempfile.mktemp()
             self.new_name = self.generate_name(self.in_name)
-            self.f = open(self.temp_name, "w", encoding=self.encoding)
+            # The new file is compressed like the original and a zip archive
+            # gets the name of the GEDCOM file read from the original
+            compression = sniff_compression(self.in_name)
+            member = archive_member_name(self.in_name) if compression == "zip" else None
+            self.f = open_output(self.temp_name, self.encoding, self.buffer_size,
+                                 compression, member)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            # The output is incomplete: keep the input file as it is
+            self.pending = []
+            self.f.close()
+            if self.new_name:
+                os.remove(self.temp_name)
+            return
+        self.flush()
         self.f.close()
         if 'dryrun' in self.run_args and self.run_args['dryrun']:
             return
         self.save()
 
     def emit(self, line):
-        ''' Process an input line '''
-        if self.display_changes and self.original_line and \
-                line.strip() != self.original_line:
-            print('{:>36} --> {}'.format(self.original_line, line))
-            self.original_line = ""
-        self.f.write(line+"\n")
-
+        ''' Process the first output line.
+            Writes also the transform log note and then replaces this method
+            with a faster one for the rest of the lines.
+        '''
+        if self.display_changes:
+            self._emit_display(line)
+        else:
+            self.pending.append(line)
         if self.log:
             #TODO: Should follow a setting from gedder.py
             self.log = False
-            args = sys.argv[1:]
-            try:
-                v = " v." + _VERSION
-            except NameError:
-                v = ""
-            self.emit("1 NOTE _TRANSFORM{} {}".format(v, sys.argv[0]))
-            self.emit("2 CONT _COMMAND {} {}".\
-                      format(os.path.basename(sys.argv[0]), " ".join(args)))
-            user = getpass.getuser()
-            if not user:
-                user = "Unnamed"
-            datestring = time.strftime("%d %b %Y %H:%M:%S", 
-                                       time.localtime(time.time()))
-            self.emit("2 CONT _DATE {} {}".format(user, datestring))
-            if self.new_name:
-                self.emit("2 CONT _SAVEDFILE " + self.new_name)
+            self.pending.extend(self.log_lines())
+        if self.display_changes:
+            self.emit = self._emit_display
+        else:
+            self.emit = self._emit_plain
+
+    def _emit_plain(self, line):
+        ''' Process an output line '''
+        pending = self.pending
+        pending.append(line)
+        if len(pending) >= _BATCH_LINES:
+            self.flush()
+
+    def _emit_display(self, line):
+        ''' Process an output line and display it, if it differs from the original '''
+        if self.original_line and line.strip() != self.original_line:
+            print('{:>36} --> {}'.format(self.original_line, line))
+            self.original_line = ""
+        self._emit_plain(line)
+
+    def emit_many(self, lines):
+        ''' Process a sequence of output lines '''
+        if self.log or self.display_changes:
+            for line in lines:
+                self.emit(line)
+            return
+        pending = self.pending
+        pending.extend(lines)
+        if len(pending) >= _BATCH_LINES:
+            self.flush()
+
+    def flush(self):
+        ''' Write the collected lines '''
+        if self.pending:
+            self.pending.append("")
+            self.f.write("\n".join(self.pending))
+            self.pending = []
+
+    def log_lines(self):
+        ''' The note describing this transform run '''
+        args = sys.argv[1:]
+        try:
+            v = " v." + _VERSION
+        except NameError:
+            v = ""
+        ret = ["1 NOTE _TRANSFORM{} {}".format(v, sys.argv[0])]
+        ret.append("2 CONT _COMMAND {} {}".\
+                   format(os.path.basename(sys.argv[0]), " ".join(args)))
+        user = getpass.getuser()
+        if not user:
+            user = "Unnamed"
+        datestring = time.strftime("%d %b %Y %H:%M:%S", 
+                                   time.localtime(time.time()))
+        ret.append("2 CONT _DATE {} {}".format(user, datestring))
+        if self.new_name:
+            ret.append("2 CONT _SAVEDFILE " + self.new_name)
+        return ret
 
     def save(self):
-        if self.out_name:
+        if is_stream(self.out_name):
+            LOG.info("Tulostettu vakiotulosteeseen")
+        elif self.out_name:
             msg = "Tulostiedosto '{}'".format(self.out_name)
             print(msg)
             LOG.info(msg)
@@ -106,3 +186,26 @@ class Output:
             i += 1
 
 
+
+
+class LineSink:
+    '''
+    An in-memory output for a transform in the middle of a chain.
+    The emitted lines are collected until they are taken with take().
+    '''
+    def __init__(self):
+        self.display_changes = False
+        self.original_line = ""
+        self.pending = []
+
+    def emit(self, line):
+        self.pending.append(line)
+
+    def emit_many(self, lines):
+        self.pending.extend(lines)
+
+    def take(self):
+        ''' Returns and forgets the collected lines '''
+        lines = self.pending
+        self.pending = []
+        return lines
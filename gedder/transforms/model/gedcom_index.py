@@ -0,0 +1,211 @@
+'''
+Record offset index of a GEDCOM file.
+
+The index is stored beside the GEDCOM file in a sidecar file "<name>.gedidx".
+It contains the byte offset, length, record type and xref of every level 0
+record, e.g. for the record
+
+    0 @I0001@ INDI
+    1 NAME Antti /Puuhaara/
+
+the entry (offset, length, 'INDI', '@I0001@').
+
+The index is valid as long as the size, the modification time and a hash of
+the GEDCOM file are unchanged. The hash is computed from sampled blocks in the
+beginning, middle and end of the file, so checking it does not read the whole
+file.
+
+Usage:
+    index = get_index("sukuni.ged", "utf-8")
+    for line in index.lines(index.find("@I0001@"), "utf-8"): ...
+    for entry in index.of_type("FAM"): ...
+
+With the option --index the core creates or updates the index of the input
+file in the beginning of the run and gives it to the transforms in
+run_args['gedcom_index'] (None, if the input can't be indexed). A transform
+reads the records as RecordLines objects with
+    index = read_index(run_args)
+    record = read_record(run_args, index, "@I0001@")
+    for record in read_records_of_type(run_args, index, "FAM"): ...
+'''
+
+import os
+import json
+import hashlib
+import logging
+LOG = logging.getLogger(__name__)
+
+from transforms.model.gedcom_io import is_plain_file, bytes_compatible, bytes_encoding
+from transforms.model.gedcom_line import GedcomLine
+from transforms.model.gedcom_path import PathTracker
+from transforms.model.record_lines import RecordLines
+
+SUFFIX = ".gedidx"
+_FORMAT = 1                 # Version of the sidecar format
+_SAMPLE_SIZE = 64 * 1024    # Size of each hashed block
+
+
+def index_name(name):
+    ''' The name of the sidecar file of a GEDCOM file '''
+    return name + SUFFIX
+
+
+def file_signature(name):
+    ''' Returns (size, mtime, hash) of a file '''
+    st = os.stat(name)
+    h = hashlib.blake2b(digest_size=16)
+    with open(name, "rb") as f:
+        for pos in (0, st.st_size // 2, st.st_size - _SAMPLE_SIZE):
+            f.seek(max(pos, 0))
+            h.update(f.read(_SAMPLE_SIZE))
+    return st.st_size, st.st_mtime_ns, h.hexdigest()
+
+
+class GedcomIndex(object):
+    '''
+    The level 0 records of a GEDCOM file.
+
+    Each entry is a tuple (offset, length, type, xref), where the type is
+    the tag of the record (INDI, FAM, HEAD ...) and xref is the first
+    tag of the level 0 line, like GedcomLine.xref ('@I0001@', 'HEAD' ...).
+    '''
+
+    def __init__(self, name, signature, entries):
+        self.name = name
+        self.signature = signature
+        self.entries = entries
+        self.by_xref = {entry[3]: entry for entry in entries}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def find(self, xref):
+        ''' Returns the entry of a record or None '''
+        return self.by_xref.get(xref)
+
+    def of_type(self, rtype):
+        ''' Returns the entries of given record type in file order '''
+        return [entry for entry in self.entries if entry[2] == rtype]
+
+    def counts(self):
+        ''' Returns the number of records for each record type '''
+        cnt = {}
+        for entry in self.entries:
+            cnt[entry[2]] = cnt.get(entry[2], 0) + 1
+        return cnt
+
+    def lines(self, entry, encoding):
+        ''' Reads the lines of a record (without line terminators) '''
+        encoding = bytes_encoding(encoding)
+        offset, length = entry[0], entry[1]
+        with open(self.name, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        if offset == 0 and data.startswith(b"\xef\xbb\xbf"):
+            data = data[3:]
+        return [line for line in data.decode(encoding).splitlines() if line]
+
+    def save(self):
+        ''' Writes the sidecar file '''
+        data = {
+            'format': _FORMAT,
+            'signature': list(self.signature),
+            'entries': self.entries,
+        }
+        with open(index_name(self.name), "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+
+def parse_head(raw):
+    ''' Returns (type, xref) of a raw level 0 line '''
+    tkns = raw.split(None, 2)
+    if len(tkns) < 2:
+        return "", ""
+    if len(tkns) > 2 and tkns[1].startswith(b"@"):
+        rtype = tkns[2].split(None, 1)[0]
+    else:
+        rtype = tkns[1]
+    return rtype.decode("latin-1"), tkns[1].decode("latin-1")
+
+
+def build_index(name):
+    ''' Scans the file once and returns a new index '''
+    signature = file_signature(name)
+    entries = []
+    start = None
+    head = None
+    offset = 0
+    with open(name, "rb") as f:
+        for raw in f:
+            if raw.lstrip(b"\xef\xbb\xbf \t")[:2] == b"0 ":
+                if head is not None:
+                    entries.append([start, offset - start] + list(head))
+                start = offset
+                head = parse_head(raw.lstrip(b"\xef\xbb\xbf"))
+            offset += len(raw)
+    if head is not None:
+        entries.append([start, offset - start] + list(head))
+    return GedcomIndex(name, signature, [tuple(entry) for entry in entries])
+
+
+def load_index(name):
+    ''' Returns the index from the sidecar file, if it is valid, otherwise None '''
+    try:
+        with open(index_name(name), encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get('format') != _FORMAT:
+            return None
+        signature = tuple(data['signature'])
+        if signature != file_signature(name):
+            return None
+        return GedcomIndex(name, signature, [tuple(entry) for entry in data['entries']])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def get_index(name, encoding, create=True):
+    ''' Returns a valid index of the file; it is built and saved, if needed.
+        Returns None for the inputs that can't be indexed (stdin, compressed
+        files, encodings like UTF-16)
+    '''
+    if not bytes_compatible(encoding) or not is_plain_file(name):
+        return None
+    index = load_index(name)
+    if index is None and create:
+        LOG.info("Luodaan indeksi %s", index_name(name))
+        index = build_index(name)
+        try:
+            index.save()
+        except OSError as err:
+            LOG.warning("Indeksiä ei voi tallettaa: %s", err)
+    return index
+
+
+def read_index(run_args, create=True):
+    ''' Returns the record index of the input file, the one made by the core with
+        --index or a new one, or None, if the input can't be indexed
+    '''
+    if 'gedcom_index' in run_args:
+        return run_args['gedcom_index']
+    return get_index(run_args['input_gedcom'], run_args['encoding'], create)
+
+
+def read_indexed_record(run_args, index, entry, tracker=None):
+    ''' Reads one record of the index as a RecordLines object '''
+    tracker = tracker or PathTracker()
+    lines = index.lines(entry, run_args['encoding'])
+    return RecordLines([GedcomLine(line, 0, tracker) for line in lines])
+
+
+def read_record(run_args, index, xref, tracker=None):
+    ''' Reads the record with given xref, e.g. '@I0001@', or returns None '''
+    entry = index.find(xref)
+    if entry is None:
+        return None
+    return read_indexed_record(run_args, index, entry, tracker)
+
+
+def read_records_of_type(run_args, index, rtype, tracker=None):
+    ''' Reads the records of given type, e.g. 'FAM', in file order '''
+    for entry in index.of_type(rtype):
+        yield read_indexed_record(run_args, index, entry, tracker)
@@ -0,0 +1,334 @@
+'''
+Opening the GEDCOM input and output files.
+
+The name '-' means the standard input or output.
+The input may be compressed with gzip, bzip2, xz (lzma) or zip; the format is
+recognized from the first bytes of the file, also on the standard input (a zip
+archive is then first copied to a temporary file). The output is compressed
+according to the suffix of the file name: .gz, .bz2, .xz, .lzma or .zip.
+
+A zip input must contain one GEDCOM file (or several files of which the
+first .ged file is read). A zip output contains one file, named as the
+output file without the .zip suffix; when a zip input is rewritten in place,
+the name of the GEDCOM file read from it is kept.
+
+The character encoding of the input can be detected with sniff_encoding()
+from the byte order mark or from the "1 CHAR" line of the header.
+'''
+
+import sys
+import os
+import io
+import codecs
+import importlib
+
+import transforms.model.ansel     # Registers the "ansel" codec
+
+STREAM = "-"
+_SNIFF_SIZE = 64 * 1024     # Bytes read for detecting the encoding
+
+# The first bytes of the compressed files
+_MAGIC = [
+    (b"\x1f\x8b", "gz"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"PK\x03\x04", "zip"),
+]
+
+# The byte order marks
+_BOMS = [
+    (codecs.BOM_UTF8, "utf-8"),         # The reader skips the BOM
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+# The GEDCOM "1 CHAR" values
+_CHARSETS = {
+    "UTF-8": "utf-8",
+    "UTF8": "utf-8",
+    "UNICODE": "utf-8",     # without a byte order mark
+    "ASCII": "utf-8",
+    "ANSEL": "ansel",
+    "ANSI": "cp1252",
+    "WINDOWS": "cp1252",
+    "IBM WINDOWS": "cp1252",
+    "IBMPC": "cp437",
+    "IBM PC": "cp437",
+    "MSDOS": "cp437",
+    "MACINTOSH": "mac_roman",
+    "LATIN1": "iso8859-1",
+}
+
+_SUFFIXES = {
+    ".gz": "gz",
+    ".bz2": "bz2",
+    ".xz": "xz",
+    ".lzma": "xz",
+    ".zip": "zip",
+}
+
+# The modules opening the compressed files; they are imported when needed
+_OPENERS = {
+    "gz": "gzip",
+    "bz2": "bz2",
+    "xz": "lzma",
+}
+
+# The decompressed binary stream of stdin; it is created once, as stdin can
+# be read only once
+_stdin = []
+
+
+class _ArchiveMember(io.TextIOWrapper):
+    ''' A text stream of a zip member, which closes also the archive '''
+    archive = None
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self.archive is not None:
+                self.archive.close()
+                self.archive = None
+
+
+class _Unclosed(io.TextIOWrapper):
+    ''' A text stream of stdin or stdout, which leaves the underlying stream open '''
+
+    def close(self):
+        if not self.closed:
+            if self.writable():
+                self.flush()
+            self.detach()
+
+    @property
+    def closed(self):
+        try:
+            return self.buffer.closed
+        except ValueError:
+            # Already detached
+            return True
+
+
+def is_stream(name):
+    ''' True, if the name means stdin or stdout '''
+    return name == STREAM
+
+
+def _magic_format(head):
+    ''' The compression format recognized from the first bytes or None '''
+    for magic, fmt in _MAGIC:
+        if head.startswith(magic):
+            return fmt
+    return None
+
+
+def _open_compressed(fmt, name, mode, **kwargs):
+    ''' Opens a gzip, bzip2 or xz file (or binary stream) '''
+    return importlib.import_module(_OPENERS[fmt]).open(name, mode, **kwargs)
+
+
+def sniff_compression(name):
+    ''' The compression format of an existing file or None '''
+    with open(name, "rb") as f:
+        return _magic_format(f.read(6))
+
+
+def stdin_binary():
+    ''' The standard input as a binary stream with peek(), decompressed if needed '''
+    if not _stdin:
+        raw = sys.stdin.buffer
+        fmt = _magic_format(raw.peek(6)[:6])
+        if fmt is None:
+            stream = raw
+        elif fmt == "zip":
+            import shutil
+            import tempfile
+            import zipfile
+            # zipfile needs a seekable file
+            copy = tempfile.TemporaryFile()
+            shutil.copyfileobj(raw, copy)
+            copy.seek(0)
+            archive = zipfile.ZipFile(copy)
+            stream = io.BufferedReader(archive.open(_gedcom_member(archive, STREAM)),
+                                       _SNIFF_SIZE)
+        else:
+            stream = io.BufferedReader(_open_compressed(fmt, raw, "rb"), _SNIFF_SIZE)
+        _stdin.append(stream)
+    return _stdin[0]
+
+
+def suffix_compression(name):
+    ''' The compression format implied by the file name or None '''
+    return _SUFFIXES.get(os.path.splitext(name)[1].lower())
+
+
+def read_head(name, size=_SNIFF_SIZE):
+    ''' Returns the first bytes of the input (decompressed) without consuming stdin '''
+    if is_stream(name):
+        return stdin_binary().peek(size)[:size]
+    fmt = sniff_compression(name)
+    if fmt is None:
+        with open(name, "rb") as f:
+            return f.read(size)
+    if fmt == "zip":
+        with open_input(name, "latin-1") as f:
+            return f.buffer.read(size)
+    with _open_compressed(fmt, name, "rb") as f:
+        return f.read(size)
+
+
+def _valid(head, encoding):
+    ''' True, if the bytes can be decoded; the last character may be incomplete '''
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(head, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def header_charset(text):
+    ''' The value of the "1 CHAR" line of the header or None '''
+    for i, line in enumerate(text.splitlines()):
+        line = line.strip()
+        if line.startswith("0") and i > 0:
+            break
+        if line.startswith("1 CHAR"):
+            return line[6:].strip().upper()
+    return None
+
+
+def sniff_encoding(name):
+    ''' Detects the encoding of the input from the byte order mark or the "1 CHAR" line.
+        Text which is valid UTF-8 is read as UTF-8 and an unknown 8-bit text as cp1252.
+    '''
+    head = read_head(name)
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    if head[:4] in (b"0\x00 \x00", b"\x000\x00 "):
+        # UTF-16 without a byte order mark
+        return "utf-16-le" if head[0] else "utf-16-be"
+    utf8 = _valid(head, "utf-8")
+    if utf8 and not head.isascii():
+        # Some programs write UTF-8 with "1 CHAR ANSI", "ASCII" or "UNICODE"
+        return "utf-8"
+    charset = header_charset(head.decode("latin-1"))
+    if charset in _CHARSETS:
+        encoding = _CHARSETS[charset]
+    else:
+        try:
+            encoding = codecs.lookup(charset).name
+        except (LookupError, TypeError):
+            encoding = "utf-8"
+    if encoding == "utf-8" and not utf8:
+        return "cp1252"
+    return encoding
+
+
+def is_plain_file(name):
+    ''' True, if the input is a regular uncompressed file (which can be memory mapped) '''
+    return not is_stream(name) and sniff_compression(name) is None
+
+
+def _gedcom_member(archive, name):
+    ''' The name of the GEDCOM file read from the zip archive opened from name '''
+    names = [n for n in archive.namelist() if not n.endswith("/")]
+    geds = [n for n in names if n.lower().endswith(".ged")] or names
+    if not geds:
+        raise FileNotFoundError("Tyhjä zip-tiedosto '{}'".format(name))
+    return geds[0]
+
+
+def archive_member_name(name):
+    ''' The name of the GEDCOM file read from the zip archive "name" '''
+    import zipfile
+    with zipfile.ZipFile(name) as archive:
+        return _gedcom_member(archive, name)
+
+
+def zip_member_name(name):
+    ''' The name of the file inside a new zip archive "name" '''
+    member = os.path.basename(name)
+    if member.lower().endswith(".zip"):
+        member = member[:-4]
+    return member
+
+
+def bytes_compatible(encoding):
+    ''' True, if the digits, spaces and tags are single ASCII bytes in this encoding '''
+    try:
+        return "0 @I1@ INDI\n".encode(bytes_encoding(encoding)) == b"0 @I1@ INDI\n"
+    except (LookupError, UnicodeError):
+        return False
+
+
+def bytes_encoding(encoding):
+    ''' The codec used for the raw lines; the UTF-8 BOM is skipped by the reader '''
+    if codecs.lookup(encoding).name == "utf-8-sig":
+        return "utf-8"
+    return encoding
+
+
+def open_input(name, encoding):
+    ''' Opens the input for reading text lines '''
+    if is_stream(name):
+        return _Unclosed(stdin_binary(), encoding=encoding)
+    fmt = sniff_compression(name)
+    if fmt is None:
+        return open(name, encoding=encoding)
+    if fmt == "zip":
+        import zipfile
+        archive = zipfile.ZipFile(name)
+        try:
+            member = _gedcom_member(archive, name)
+        except FileNotFoundError:
+            archive.close()
+            raise
+        f = _ArchiveMember(archive.open(member), encoding=encoding)
+        f.archive = archive
+        return f
+    return _open_compressed(fmt, name, "rt", encoding=encoding)
+
+
+def input_size(name):
+    ''' The size of the input file in bytes (compressed), None for stdin '''
+    if is_stream(name):
+        return None
+    return os.path.getsize(name)
+
+
+def input_position(f):
+    ''' Returns a function returning the bytes read (before decompression) from
+        the file underlying the stream f, or None if the position is not known.
+    '''
+    try:
+        fd = f.fileno()
+        os.lseek(fd, 0, os.SEEK_CUR)
+    except (OSError, ValueError):
+        return None
+    return lambda: os.lseek(fd, 0, os.SEEK_CUR)
+
+
+def open_output(name, encoding, buffering=-1, compression=None, member=None):
+    ''' Opens the output for writing text.
+        The compression is taken from the name, if not given.
+        The member is the file name inside a zip output.
+    '''
+    if is_stream(name):
+        sys.__stdout__.flush()
+        return _Unclosed(sys.__stdout__.buffer, encoding=encoding)
+    fmt = compression or suffix_compression(name)
+    if fmt is None:
+        return open(name, "w", encoding=encoding, buffering=buffering)
+    if fmt == "zip":
+        if member is None:
+            member = zip_member_name(name)
+        import zipfile
+        archive = zipfile.ZipFile(name, "w", compression=zipfile.ZIP_DEFLATED)
+        f = _ArchiveMember(archive.open(member, "w"), encoding=encoding)
+        f.archive = archive
+        return f
+    return _open_compressed(fmt, name, "wt", encoding=encoding)
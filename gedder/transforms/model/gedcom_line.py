@@ -4,31 +4,41 @@ Created on 16.1.2017
 @author: jm
 '''
 
+from transforms.model.gedcom_path import PATHS, PathTracker
+
+
 class GedcomLine(object):
     '''
     Gedcom line container, which can also carry the lower level gedcom lines.
-    
+
     Example
     - level     2
     - tag       'GIVN'
     - value     'Johan' ...}
+
+    The path of the line is stored as two parts:
+    - xref      '@I0001@', the tag of the level 0 line
+    - path_id   integer id of the tags below level 0, ('NAME', 'GIVN'),
+                see transforms.model.gedcom_path
     '''
-    # Current path elemements
+    __slots__ = ('line', 'linenum', 'level', 'tag', 'value', 'xref', 'path_id', 'attributes')
+
+    # Current path of the lines created without an own tracker
     # See https://docs.python.org/3/faq/programming.html#how-do-i-create-static-class-data-and-static-class-methods
-    path_elem = []
+    tracker = PathTracker()
 
-    def __init__(self, line, linenum=0):
+    def __init__(self, line, linenum=0, tracker=None):
         '''
         Constructor: Parses and stores a gedcom line
-        
+
         Different constructors:
             GedcomLine("1 GIVN Ville")
             GedcomLine("1 GIVN Ville", 20)
             GedcomLine((1, "GIVN", "Ville"))
             GedcomLine((1, "GIVN", "Ville"), 20)
+            GedcomLine("1 GIVN Ville", 20, tracker)
         '''
-        self.path = ""
-        self.attributes = {}
+        self.attributes = None
         self.linenum = linenum
 
         if type(line) == str:
@@ -44,8 +54,8 @@ class GedcomLine(object):
         else:
             self.value = ""
             self.line = str(self)
-        self.set_path(self.level, self.tag)
-            
+        self.set_path(self.level, self.tag, tracker)
+
 
     def __str__(self):
         ''' Get the original line '''
@@ -54,33 +64,45 @@ class GedcomLine(object):
         except:
             ret = "* Not complete *"
         return ret
-    
 
-    def set_path(self, level, tag):
+
+    @property
+    def path(self):
+        ''' The hierarchy of the tags, e.g. '@I0001@.NAME.GIVN' '''
+        return self.xref + PATHS.suffixes[self.path_id]
+
+
+    @property
+    def tags(self):
+        ''' The tags below level 0, e.g. ('NAME', 'GIVN') '''
+        return PATHS.tags[self.path_id]
+
+
+    def set_path(self, level, tag, tracker=None):
         ''' Update self.path with given tag and level '''
-        if level > len(GedcomLine.path_elem):
-            raise RuntimeError("{} Invalid level {}: {}".format(self.path, level, self.line))
-        if level == len(GedcomLine.path_elem):
-            GedcomLine.path_elem.append(tag)
-        else:
-            GedcomLine.path_elem[level] = tag
-            GedcomLine.path_elem = GedcomLine.path_elem[:self.level+1]
-        self.path = ".".join(GedcomLine.path_elem)
-        return self.path
+        elem = (tracker or GedcomLine.tracker).set(level, tag)
+        if elem is None:
+            raise RuntimeError("Invalid level {}: {}".format(level, self.line))
+        self.xref, self.path_id = elem
+        if self.path_id:
+            # Share the interned tag string
+            self.tag = PATHS.tags[self.path_id][-1]
 
 
     def set_attr(self, key, value):
         ''' Optional attributes like name TYPE as a tuple {'TYPE':'marriage'} '''
+        if self.attributes is None:
+            self.attributes = {}
         self.attributes[key] = value
 
-    
+
     def get_attr(self, key):
         ''' Get optional attribute value '''
-        if key in self.attributes:
+        if self.attributes and key in self.attributes:
             return self.attributes[key]
         return None
 
-    
+
     def get_year(self):
         '''If value has a four digit last part, the numeric value of it is returned
         '''
@@ -96,3 +118,58 @@ class GedcomLine(object):
         # Print out current line to file f
         f.emit(str(self))
 
+
+class LazyGedcomLine(GedcomLine):
+    '''
+    Gedcom line parsed directly from the raw bytes of the input file.
+
+    The level and the tag are parsed immediately, but the value and the
+    original line are decoded only when they are used.
+    '''
+    __slots__ = ('encoding', 'raw', '_value', '_line')
+
+    def __init__(self, raw, linenum, encoding, tracker=None):
+        '''
+        Constructor: Parses the level and tag of a raw line
+            LazyGedcomLine(b"2 PLAC Pielavesi", 20, "utf-8")
+        '''
+        self.attributes = None
+        self.linenum = linenum
+        self.encoding = encoding
+        self.raw = raw
+        self._value = None
+        self._line = None
+
+        tkns = raw.split(None, 2)
+        self.level = int(tkns[0])
+        self.tag = tkns[1].decode(encoding)
+        self.set_path(self.level, self.tag, tracker)
+
+    @property
+    def value(self):
+        ''' The value is decoded when it is used first time '''
+        if self._value is None:
+            tkns = self.raw.split(None, 2)
+            if len(tkns) > 2:
+                self._value = tkns[2].decode(self.encoding)
+            else:
+                self._value = ""
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+
+    @property
+    def line(self):
+        ''' The original line is decoded when it is used first time '''
+        if self._line is None:
+            if self.value:
+                self._line = self.raw.decode(self.encoding)
+            else:
+                self._line = str(self)
+        return self._line
+
+    @line.setter
+    def line(self, line):
+        self._line = line
@@ -0,0 +1,143 @@
+'''
+Integer ids for GEDCOM tag paths and precompiled path patterns.
+
+The path of a GedcomLine like '@I0001@.BIRT.PLAC' is stored as two parts:
+- the xref '@I0001@', i.e. the tag of the level 0 line of the record
+- an integer path id for the tags below level 0, ('BIRT', 'PLAC')
+
+Every distinct tag hierarchy gets its own id from the shared table PATHS,
+so the lines of different records with the same hierarchy have the same id.
+Level 0 lines have the id 0.
+
+A transform compiles its path patterns once
+    BIRT_PLAC = PathPattern("*.BIRT.PLAC")
+and tests the lines with
+    if BIRT_PLAC.match(gedline): ...
+The result is computed only once for each path id.
+'''
+
+import sys
+from fnmatch import fnmatchcase
+
+
+class PathTable(object):
+    '''
+    Assigns an integer id for each distinct tag hierarchy.
+    '''
+
+    def __init__(self):
+        self.children = {}      # (parent id, tag) -> id
+        self.tags = [()]        # id -> tuple of tags, e.g. ('BIRT', 'PLAC')
+        self.suffixes = [""]    # id -> path without the xref, e.g. '.BIRT.PLAC'
+
+    def __len__(self):
+        return len(self.tags)
+
+    def child(self, parent, tag):
+        ''' Returns the id of the tag hierarchy parent.tag '''
+        path_id = self.children.get((parent, tag))
+        if path_id is None:
+            path_id = self.add(parent, tag)
+        return path_id
+
+    def add(self, parent, tag):
+        ''' Stores a new tag hierarchy and returns it's id '''
+        tag = sys.intern(tag)
+        path_id = len(self.tags)
+        self.tags.append(self.tags[parent] + (tag,))
+        self.suffixes.append(self.suffixes[parent] + "." + tag)
+        self.children[(parent, tag)] = path_id
+        return path_id
+
+    def lookup(self, tags):
+        ''' Returns the id of a tuple of tags or None if it has not been seen '''
+        path_id = 0
+        for tag in tags:
+            path_id = self.children.get((path_id, tag))
+            if path_id is None:
+                return None
+        return path_id
+
+
+# The table shared by all lines
+PATHS = PathTable()
+
+
+class PathTracker(object):
+    '''
+    Keeps track of the current path in a sequence of lines.
+
+    Each reader of GEDCOM lines has it's own tracker, so that the lines
+    of different sources can be parsed at the same time.
+    '''
+
+    def __init__(self):
+        self.stack = []     # (xref, path id) for each level
+
+    def set(self, level, tag):
+        ''' Returns (xref, path id) for a line with given level and tag '''
+        stack = self.stack
+        if level > len(stack):
+            return None
+        del stack[level:]
+        if level == 0:
+            elem = (tag, 0)
+        else:
+            xref, parent = stack[level - 1]
+            elem = (xref, PATHS.child(parent, tag))
+        stack.append(elem)
+        return elem
+
+
+def _match_tags(pattern, tags):
+    ''' Matches the tags with the pattern elements; '**' matches zero or more tags '''
+    if not pattern:
+        return not tags
+    if pattern[0] == "**":
+        for i in range(len(tags) + 1):
+            if _match_tags(pattern[1:], tags[i:]):
+                return True
+        return False
+    if not tags:
+        return False
+    return fnmatchcase(tags[0], pattern[0]) and _match_tags(pattern[1:], tags[1:])
+
+
+class PathPattern(object):
+    '''
+    A compiled path pattern.
+
+    The first element of the pattern is matched with the xref of the record
+    and the other elements with the tags below it, e.g.
+        "*.BIRT.PLAC"       PLAC of a BIRT in any record
+        "*.**.SOUR"         SOUR at any level below level 0
+        "@S*.TITL"          TITL of a record with xref starting with @S
+        "*"                 any level 0 line
+    An element may contain the wildcards of fnmatch; '**' matches any number
+    of tags.
+    '''
+
+    def __init__(self, pattern):
+        parts = pattern.split(".")
+        self.pattern = pattern
+        self.xref = parts[0]
+        self.any_xref = (self.xref == "*")
+        self.tags = tuple(parts[1:])
+        self.results = {}   # path id -> bool
+
+    def __repr__(self):
+        return "PathPattern({!r})".format(self.pattern)
+
+    def match_id(self, path_id):
+        ''' Tests the tags of a path id '''
+        result = self.results.get(path_id)
+        if result is None:
+            result = _match_tags(self.tags, PATHS.tags[path_id])
+            self.results[path_id] = result
+        return result
+
+    def match(self, gedline):
+        ''' Tests the path of a GedcomLine '''
+        if not self.match_id(gedline.path_id):
+            return False
+        return self.any_xref or fnmatchcase(gedline.xref, self.xref)
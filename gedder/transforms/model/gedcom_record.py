@@ -38,10 +38,11 @@ class GedcomRecord(GedcomLine):
         # The name found first, userd for default GIVN, _CALL, NICK
         self.name_default = None
         # Store level 0 line
-        if not type(gedline) is GedcomLine:
+        if not isinstance(gedline, GedcomLine):
             raise RuntimeError("GedcomLine argument expected")
         self.level = gedline.level
-        self.path = gedline.path
+        self.xref = gedline.xref
+        self.path_id = gedline.path_id
         self.value = gedline.value
         self.add_member(gedline)
 
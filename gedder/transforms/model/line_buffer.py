@@ -0,0 +1,128 @@
+'''
+Buffer for the parsed lines of a GEDCOM file.
+
+The lines read during the first traverse are stored here so that the
+second traverse ("phase3") can replay them without reading, decoding and
+parsing the input file again.
+
+Each line is kept as a tuple of its parsed parts (linenum, level, tag, value,
+line), from which phase3 gets a new GedcomLine without splitting the text
+again; the changes made by phase1 to the GedcomLine objects are not seen by
+phase3, as when the file is read twice. A line read from the raw bytes
+(LazyGedcomLine, see --mmap) is kept as (linenum, raw bytes), so that its
+value is still decoded only when it is used.
+
+When the estimated size of the tuples exceeds the memory budget, they are
+pickled in batches to an anonymous temporary file and the rest of the lines
+are appended there.
+'''
+
+import pickle
+
+from transforms.model.gedcom_line import GedcomLine, LazyGedcomLine
+
+# Estimated memory used by the tuple of a line besides the characters of the line
+_LINE_OVERHEAD = 200
+# Number of lines pickled at a time to the temporary file
+_BATCH_SIZE = 10000
+
+
+class LineBuffer(object):
+    '''
+    Stores GEDCOM lines for replaying.
+
+    Usage:
+        buf = LineBuffer(256 * 1024 * 1024)
+        for gedline in ...:
+            buf.append(gedline)
+        for gedline in buf.replay(tracker):
+            ...
+        buf.close()
+    '''
+
+    def __init__(self, budget):
+        ''' Creates an empty buffer.
+            The budget is the maximum amount of memory (in bytes) used by the
+            lines kept in memory.
+        '''
+        self.budget = budget
+        self.size = 0           # Estimated bytes used by the lines in memory
+        self.count = 0          # Lines stored so far
+        self.lines = []         # The tuples of the lines in memory (or of the next batch)
+        self.encoding = None    # The encoding of the raw lines
+        self.spillfile = None   # Temporary file, if the budget was exceeded
+
+    def __len__(self):
+        return self.count
+
+    def append(self, gedline):
+        ''' Stores one GedcomLine '''
+        self.count += 1
+        if isinstance(gedline, LazyGedcomLine):
+            # The line is not decoded here
+            self.encoding = gedline.encoding
+            self.lines.append((gedline.linenum, gedline.raw))
+            size = len(gedline.raw)
+        else:
+            line = gedline.line
+            self.lines.append((gedline.linenum, gedline.level, gedline.tag,
+                               gedline.value, line))
+            size = 2 * len(line)
+        if self.spillfile is not None:
+            if len(self.lines) >= _BATCH_SIZE:
+                self._write()
+            return
+        self.size += _LINE_OVERHEAD + size
+        if self.size > self.budget:
+            import tempfile
+            self.spillfile = tempfile.TemporaryFile()
+            self._write()
+            self.size = 0
+
+    def _write(self):
+        ''' Moves the tuples kept in memory to the temporary file '''
+        pickle.dump(self.lines, self.spillfile, pickle.HIGHEST_PROTOCOL)
+        self.lines = []
+
+    @property
+    def spilled(self):
+        ''' True, if the lines are stored in a temporary file '''
+        return self.spillfile is not None
+
+    def _batches(self):
+        ''' The lists of tuples stored '''
+        if self.spillfile is None:
+            yield self.lines
+            return
+        if self.lines:
+            self._write()
+        self.spillfile.flush()
+        self.spillfile.seek(0)
+        while True:
+            try:
+                yield pickle.load(self.spillfile)
+            except EOFError:
+                return
+
+    def replay(self, tracker=None):
+        ''' Returns the stored lines as new GedcomLine objects with their
+            original line numbers. The tracker follows the path of the lines,
+            as the lines created by phase3 get their paths from it.
+        '''
+        encoding = self.encoding
+        for batch in self._batches():
+            for parts in batch:
+                if len(parts) == 2:
+                    yield LazyGedcomLine(parts[1], parts[0], encoding, tracker)
+                else:
+                    linenum, level, tag, value, line = parts
+                    gedline = GedcomLine((level, tag, value), linenum, tracker)
+                    gedline.line = line
+                    yield gedline
+
+    def close(self):
+        ''' Releases the stored lines '''
+        self.lines = []
+        if self.spillfile is not None:
+            self.spillfile.close()
+            self.spillfile = None
@@ -0,0 +1,55 @@
+'''
+A bounded cache of computed values.
+
+The cache keeps at most maxsize items; when it is full, the least recently
+used item is dropped. The numbers of the hits and misses are counted for
+the statistics of the run.
+
+Usage:
+    cache = LRUCache(10000)
+    value = cache.get(key)
+    if value is None:
+        value = compute(key)
+        cache.put(key, value)
+    LOG.info("%s osumaa, %s ohitusta", cache.hits, cache.misses)
+'''
+
+import collections
+
+
+class LRUCache(object):
+    ''' A dict with at most maxsize items; None values are not stored '''
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key):
+        ''' The value stored for the key or None '''
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        ''' Stores the value; None is not stored, as get() returns it for a missing key '''
+        if value is None:
+            return
+        self.data[key] = value
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        ''' Removes the items and resets the statistics '''
+        self.data.clear()
+        self.hits = 0
+        self.misses = 0
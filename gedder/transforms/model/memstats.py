@@ -0,0 +1,104 @@
+'''
+Memory use of a transform run (the option --memstats).
+
+The allocations are traced with tracemalloc from the start of the run.
+At the end of each phase a snapshot is taken and logged:
+- the memory allocated by Python now and at the peak of the phase
+- the peak resident set size of the process so far
+- the numbers of GedcomLine objects by class (GedcomLine, LazyGedcomLine,
+  PersonName, GedcomRecord) alive
+- the source lines where the allocated memory grew most during the phase
+
+The report is logged at once, so the log shows the phases completed before
+the process was killed for running out of memory.
+
+Usage:
+    stats = MemStats()
+    stats.start()
+    ...
+    stats.snapshot("phase1 names")
+    ...
+    stats.stop()
+'''
+
+import gc
+import tracemalloc
+import collections
+import logging
+LOG = logging.getLogger(__name__)
+
+from transforms.model.gedcom_line import GedcomLine
+from transforms.model.person_name import PersonName
+from transforms.model.gedcom_record import GedcomRecord
+
+_TOP_SITES = 10         # Number of allocation sites reported per phase
+_FRAMES = 1             # Number of frames stored per allocation
+# The classes always shown in the object counts
+_COUNTED = (GedcomLine.__name__, PersonName.__name__, GedcomRecord.__name__)
+_MB = 1024.0 * 1024
+
+
+def peak_rss():
+    ''' The peak resident set size of the process in bytes or None '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Kilobytes in Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def count_objects():
+    ''' The numbers of the live objects of GedcomLine and it's subclasses by class name '''
+    counts = collections.Counter({name: 0 for name in _COUNTED})
+    for obj in gc.get_objects():
+        if isinstance(obj, GedcomLine):
+            counts[type(obj).__name__] += 1
+    return counts
+
+
+class MemStats(object):
+    ''' Takes and logs the snapshots of the memory use at the phase boundaries '''
+
+    def __init__(self, top=_TOP_SITES):
+        self.top = top
+        self.previous = None
+        self.started = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(_FRAMES)
+            self.started = True
+        self.previous = self.take_snapshot()
+
+    def take_snapshot(self):
+        # Without the snapshots themselves
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+    def stop(self):
+        if self.started:
+            tracemalloc.stop()
+            self.started = False
+        self.previous = None
+
+    def snapshot(self, phase):
+        ''' Logs the memory use at the end of a phase '''
+        if self.previous is None:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        rss = peak_rss()
+        LOG.info("Muisti %s: varattu %.1f MB, huippu %.1f MB%s", phase, current / _MB, peak / _MB,
+                 ", RSS huippu %.1f MB" % (rss / _MB) if rss else "")
+        counts = count_objects()
+        LOG.info("  Oliot: %s", ", ".join("{} {}".format(name, count)
+                                          for name, count in sorted(counts.items())))
+        snapshot = self.take_snapshot()
+        grown = [stat for stat in snapshot.compare_to(self.previous, 'lineno') if stat.size_diff > 0]
+        for stat in grown[:self.top]:
+            frame = stat.traceback[0]
+            LOG.info("  %+10.1f kB %8d lohkoa  %s:%s", stat.size_diff / 1024.0, stat.count,
+                     frame.filename, frame.lineno)
+        self.previous = snapshot
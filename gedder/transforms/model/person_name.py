@@ -74,7 +74,7 @@ class PersonName(GedcomLine):
         # is_preferred_name shall carry information, if all descendant rows from input file 
         # are included in this default name
         self.is_preferred_name = False
-        if type(gedline) == GedcomLine:
+        if isinstance(gedline, GedcomLine):
             GedcomLine.__init__(self, (gedline.level, gedline.tag, gedline.value))
         else:
             GedcomLine.__init__(self, gedline)
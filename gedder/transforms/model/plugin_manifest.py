@@ -0,0 +1,106 @@
+'''
+Static metadata of the transform plugins.
+
+The plugins (the .py files of the directory "transforms") are not imported
+for listing them or for finding a plugin by name. The first line of the module
+docstring, the module level constants "version" and "parallel_safe" and the
+names of the top level functions are read from the syntax tree of the file.
+
+The metadata is cached in the manifest file "plugin_manifest.json" in the
+plugin directory. An entry is read again when the modification time or the
+size of the file has changed. If the manifest can't be written, the files
+are parsed on each run.
+
+Usage:
+    for plugin in get_plugins("transforms"):
+        print(plugin.name, plugin.version, plugin.docline)
+        if "phase3" in plugin.functions: ...
+'''
+
+import os
+import ast
+import json
+import collections
+import logging
+LOG = logging.getLogger(__name__)
+
+MANIFEST = "plugin_manifest.json"
+_FORMAT = 1             # Version of the manifest file
+
+PluginInfo = collections.namedtuple("PluginInfo",
+                                    "name docline version parallel_safe functions")
+
+
+def _constant(node):
+    ''' The value of a constant expression or None '''
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return None
+
+
+def read_plugin_info(filename):
+    ''' Reads the metadata of a plugin file without importing it '''
+    with open(filename, "rb") as f:
+        tree = ast.parse(f.read(), filename)
+    doc = ast.get_docstring(tree, clean=False)
+    docline = doc.strip().splitlines()[0] if doc and doc.strip() else ""
+    version = ""
+    parallel_safe = False
+    functions = []
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef):
+            functions.append(node.name)
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                if not isinstance(target, ast.Name):
+                    continue
+                if target.id == "version":
+                    version = _constant(node.value) or ""
+                elif target.id == "parallel_safe":
+                    parallel_safe = bool(_constant(node.value))
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return PluginInfo(name, docline, version, parallel_safe, sorted(functions))
+
+
+def _load_manifest(name):
+    try:
+        with open(name, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get('format') != _FORMAT:
+        return {}
+    return data.get('plugins', {})
+
+
+def _save_manifest(name, plugins):
+    tmpname = name + ".tmp"
+    try:
+        with open(tmpname, "w", encoding="utf-8") as f:
+            json.dump({'format': _FORMAT, 'plugins': plugins}, f, indent=1, sort_keys=True)
+        os.replace(tmpname, name)
+    except OSError as err:
+        LOG.debug("Manifestia '%s' ei voitu tallentaa: %s", name, err)
+
+
+def get_plugins(directory="transforms"):
+    ''' Returns the PluginInfo of each plugin in the directory, sorted by name '''
+    manifest_name = os.path.join(directory, MANIFEST)
+    cached = _load_manifest(manifest_name)
+    plugins = {}
+    changed = False
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".py") or filename == "__init__.py":
+            continue
+        path = os.path.join(directory, filename)
+        st = os.stat(path)
+        entry = cached.get(filename)
+        if entry is None or entry['mtime_ns'] != st.st_mtime_ns or entry['size'] != st.st_size:
+            info = read_plugin_info(path)
+            entry = {'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'info': list(info)}
+            changed = True
+        plugins[filename] = entry
+    if changed or len(plugins) != len(cached):
+        _save_manifest(manifest_name, plugins)
+    return [PluginInfo(*entry['info']) for _filename, entry in sorted(plugins.items())]
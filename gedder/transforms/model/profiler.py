@@ -0,0 +1,183 @@
+'''
+Profiling of a transform run (the option --profile).
+
+The Profiler measures
+- the time used inside each callback of the transforms (phase1, phase2, phase3,
+  phase3_record, phase4) and the number of calls per tag; for a level 0 line
+  or a record the record type is used as the tag
+- the time used for writing the output file
+The wall and CPU times of the phases are measured by process_gedcom.
+
+With an output name (the option --profile-output NAME) the run is also
+profiled with cProfile to the pstats file NAME.pstats, and the Python call
+stacks are sampled to the file NAME.folded, which has one line
+"func1;func2;func3 count" per stack (the format used by flamegraph.pl).
+
+Usage:
+    profiler = Profiler(output_name)
+    transformer = profiler.wrap(transformer)
+    profiler.start()
+    ...
+    f.flush = profiler.timed('output', f.flush)
+    ...
+    profiler.stop()
+    for line in profiler.summary(): LOG.info(line)
+'''
+
+import os
+import time
+import signal
+import cProfile
+import collections
+
+from transforms.model.gedcom_line import GedcomLine
+from transforms.model.record_lines import RecordLines
+
+_SAMPLE_INTERVAL = 0.005    # Seconds of CPU time between the stack samples
+_CALLBACKS = ("phase1", "phase2", "phase3", "phase3_record", "phase4")
+_TOP_TAGS = 15              # Number of tags shown in the summary
+
+
+def tag_of(item):
+    ''' The tag of a GedcomLine or the record type of a RecordLines or level 0 line '''
+    if isinstance(item, RecordLines):
+        item = item.lines[0]
+    if item.level == 0 and item.value:
+        return item.value
+    return item.tag
+
+
+class ProfiledTransform(object):
+    '''
+    A transform with timed callbacks. The other attributes are taken from the
+    transform module, so the proxy can be used in place of the module.
+    '''
+
+    def __init__(self, transformer, profiler):
+        self._transformer = transformer
+        modname = transformer.__name__.split(".")[-1]
+        for callback in _CALLBACKS:
+            if hasattr(transformer, callback):
+                setattr(self, callback, profiler.callback(modname + "." + callback,
+                                                          getattr(transformer, callback)))
+
+    def __getattr__(self, name):
+        return getattr(self._transformer, name)
+
+
+class Profiler(object):
+    ''' Collects the times of the callbacks and optionally a cProfile profile and stack samples '''
+
+    def __init__(self, output_name=None):
+        self.output_name = output_name
+        self.seconds = collections.Counter()        # callback -> seconds
+        self.calls = collections.Counter()          # callback -> number of calls
+        self.tag_seconds = collections.Counter()    # (callback, tag) -> seconds
+        self.tag_calls = collections.Counter()      # (callback, tag) -> number of calls
+        self.stacks = collections.Counter()         # "func1;func2" -> samples
+        self.cprofile = None
+        self.sampling = False
+
+    def wrap(self, transformer):
+        return ProfiledTransform(transformer, self)
+
+    def callback(self, name, func):
+        ''' Returns func with the time and the tags of the calls recorded '''
+        seconds = self.seconds
+        calls = self.calls
+        tag_seconds = self.tag_seconds
+        tag_calls = self.tag_calls
+        clock = time.perf_counter
+
+        def timed_callback(run_args, *args):
+            start = clock()
+            try:
+                return func(run_args, *args)
+            finally:
+                used = clock() - start
+                seconds[name] += used
+                calls[name] += 1
+                if args and isinstance(args[0], (GedcomLine, RecordLines)):
+                    key = (name, tag_of(args[0]))
+                    tag_seconds[key] += used
+                    tag_calls[key] += 1
+        return timed_callback
+
+    def timed(self, name, func):
+        ''' Returns func with the time of the calls recorded, e.g. for the output writes '''
+        seconds = self.seconds
+        calls = self.calls
+        clock = time.perf_counter
+
+        def timed_func(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds[name] += clock() - start
+                calls[name] += 1
+        return timed_func
+
+    def start(self):
+        if not self.output_name:
+            return
+        self.cprofile = cProfile.Profile()
+        self.cprofile.enable()
+        if hasattr(signal, "setitimer"):
+            try:
+                self.old_handler = signal.signal(signal.SIGPROF, self._sample)
+            except ValueError:
+                # Not in the main thread
+                return
+            signal.setitimer(signal.ITIMER_PROF, _SAMPLE_INTERVAL, _SAMPLE_INTERVAL)
+            self.sampling = True
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append("{}:{}".format(os.path.splitext(os.path.basename(code.co_filename))[0],
+                                        code.co_name))
+            frame = frame.f_back
+        stack.reverse()
+        self.stacks[";".join(stack)] += 1
+
+    def stop(self):
+        ''' Stops the profiling and writes the output files; returns their names '''
+        if self.sampling:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, self.old_handler)
+            self.sampling = False
+        if self.cprofile is None:
+            return []
+        self.cprofile.disable()
+        names = [self.output_name + ".pstats", self.output_name + ".folded"]
+        self.cprofile.dump_stats(names[0])
+        with open(names[1], "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write("{} {}\n".format(stack, count))
+        self.cprofile = None
+        return names
+
+    def summary(self, times):
+        ''' Returns the lines of the summary; times are the phase times of process_gedcom '''
+        lines = ["Profiili:          seinä s     CPU s"]
+        for phase in ("initialize", "phase1", "phase2", "phase3", "total"):
+            lines.append("  {:12} {:10.3f} {:9.3f}".format(phase, times.get(phase, 0),
+                                                         times.get(phase + "_cpu", 0)))
+        lines.append("Profiili: kutsut       kpl   s")
+        callbacks = 0.0
+        for name, seconds in self.seconds.most_common():
+            lines.append("  {:28} {:10} {:9.3f}".format(name, self.calls[name], seconds))
+            if name != "output":
+                callbacks += seconds
+        # The reading, parsing and the other work of the core
+        core = times.get("phase1", 0) + times.get("phase2", 0) + times.get("phase3", 0) \
+               - callbacks - self.seconds["output"]
+        lines.append("  {:28} {:10} {:9.3f}".format("core", "", max(core, 0.0)))
+        if self.tag_seconds:
+            lines.append("Profiili: tagit        kpl   s")
+            for (name, tag), seconds in self.tag_seconds.most_common(_TOP_TAGS):
+                lines.append("  {:28} {:10} {:9.3f}".format(name + " " + tag,
+                                                            self.tag_calls[(name, tag)], seconds))
+        return lines
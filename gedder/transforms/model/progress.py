@@ -0,0 +1,113 @@
+'''
+Progress reports of a transform run (the option --progress).
+
+The core wraps the lines read from the input with Progress.track(). Every
+few thousand lines the clock is checked, and when the interval has passed
+a report is made: the current phase, the part of the input read (bytes of the
+input file, or lines when the lines are replayed from memory), the lines and
+level 0 records per second and the estimated time left of the phase.
+
+The report is written to stderr or to the log, and given to the callback
+run_args['progress_callback'] (e.g. a progress bar of the UI) as a
+ProgressInfo tuple.
+
+Usage:
+    progress = Progress(interval=10, callback=None, output=sys.stderr)
+    progress.phase = "phase1 places"
+    for line in progress.track(lines, size, position): ...
+'''
+
+import sys
+import time
+import collections
+import logging
+LOG = logging.getLogger(__name__)
+
+_CHECK_LINES = 4096     # Number of lines between the checks of the clock
+
+ProgressInfo = collections.namedtuple("ProgressInfo",
+    "phase done total lines records lines_per_second records_per_second eta finished")
+ProgressInfo.__doc__ = '''A progress report.
+    done and total are the bytes (or lines) read and the size of the input;
+    total and eta (seconds left) are None, if the size is not known.
+'''
+
+
+def is_record(line):
+    ''' True for a level 0 line (str or bytes) '''
+    return line[:1] in ("0", b"0")
+
+
+def format_eta(seconds):
+    seconds = int(seconds)
+    return "{}:{:02}:{:02}".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class Progress(object):
+    '''
+    The progress of the phase being run.
+
+    The output is a file (sys.stderr), "log" for the log or None for the
+    callback only.
+    '''
+
+    def __init__(self, interval, callback=None, output=sys.stderr):
+        self.interval = interval
+        self.callback = callback
+        self.output = output
+        self.phase = ""
+
+    def track(self, lines, size=None, position=None, level0=is_record):
+        '''
+        Yields the lines and reports the progress.
+        size is the size of the input and position a function returning the
+        part of it read so far; without position the lines are counted.
+        level0 tells if an item is a level 0 line.
+        '''
+        clock = time.perf_counter
+        self.started = self.reported = clock()
+        count = 0
+        records = 0
+        check = _CHECK_LINES
+        for line in lines:
+            count += 1
+            if level0(line):
+                records += 1
+            if count >= check:
+                check += _CHECK_LINES
+                now = clock()
+                if now - self.reported >= self.interval:
+                    self.reported = now
+                    self.report(now, count, records, size, position)
+            yield line
+        self.report(clock(), count, records, size, position, finished=True)
+
+    def report(self, now, count, records, size, position, finished=False):
+        seconds = max(now - self.started, 1e-9)
+        done = position() if position else count
+        if finished and size:
+            done = size
+        eta = None
+        if size and done:
+            eta = seconds * max(size - done, 0) / done
+        info = ProgressInfo(self.phase, done, size, count, records,
+                            count / seconds, records / seconds, eta, finished)
+        if self.output is not None:
+            self.write(info)
+        if self.callback:
+            self.callback(info)
+
+    def write(self, info):
+        msg = "Edistyminen: {}".format(info.phase)
+        if info.total:
+            msg += " {:.1f} %".format(100.0 * min(info.done, info.total) / info.total)
+        msg += ", {} riviä, {} tietuetta, {:.0f} riviä/s, {:.0f} tietuetta/s".format(
+            info.lines, info.records, info.lines_per_second, info.records_per_second)
+        if info.finished:
+            msg += ", valmis"
+        elif info.eta is not None:
+            msg += ", jäljellä " + format_eta(info.eta)
+        if self.output == "log":
+            LOG.info(msg)
+        else:
+            print(msg, file=self.output)
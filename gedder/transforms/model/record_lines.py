@@ -0,0 +1,82 @@
+'''
+Level 0 records as groups of GedcomLines.
+
+A record consists of a level 0 line and all the following lines with
+level > 0, e.g.
+    0 @I0001@ INDI
+    1 NAME Antti /Puuhaara/
+    1 BIRT
+    2 DATE 1 JAN 1800
+
+The lines before the first level 0 line (if any) form a record of their own.
+'''
+
+
+class RecordLines(object):
+    '''
+    The lines of one level 0 record.
+
+    Usage:
+        for record in group_records(gedlines):
+            if record.value == 'INDI':
+                for gedline in record.members(): ...
+            record.emit(f)
+    '''
+    __slots__ = ('lines',)
+
+    def __init__(self, lines):
+        self.lines = lines      # The GedcomLines, level 0 line first
+
+    def __str__(self):
+        return "RecordLines {} {} ({} riviä)".format(self.xref, self.value, len(self.lines))
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    @property
+    def head(self):
+        ''' The level 0 line '''
+        return self.lines[0]
+
+    @property
+    def xref(self):
+        ''' The xref of the record, e.g. '@I0001@' or 'HEAD' '''
+        return self.lines[0].xref
+
+    @property
+    def tag(self):
+        return self.lines[0].tag
+
+    @property
+    def value(self):
+        ''' The value of the level 0 line, e.g. 'INDI' '''
+        return self.lines[0].value
+
+    def members(self):
+        ''' Returns the lines below the level 0 line '''
+        return self.lines[1:]
+
+    def emit(self, f):
+        ''' Writes all the lines to file f '''
+        if f.display_changes:
+            for gedline in self.lines:
+                f.original_line = gedline.line.strip()
+                gedline.emit(f)
+        else:
+            for gedline in self.lines:
+                gedline.emit(f)
+
+
+def group_records(gedlines):
+    ''' Groups a sequence of GedcomLines to RecordLines objects '''
+    lines = []
+    for gedline in gedlines:
+        if gedline.level == 0 and lines:
+            yield RecordLines(lines)
+            lines = []
+        lines.append(gedline)
+    if lines:
+        yield RecordLines(lines)
@@ -0,0 +1,91 @@
+'''
+Cache of transformed records for the incremental runs.
+
+The cache is an SQLite database. For each transform key (the transform
+name, version, arguments and state, see cache_key()) it stores the hash of
+each input record and the lines (and the printed text) the transform
+produced from it. When the
+same record is met again with the same key, the stored lines are used
+instead of running phase3.
+
+The records which have not been used for _KEEP_DAYS days are removed after
+a run, so the cache does not grow forever with the old versions of the records.
+'''
+
+import time
+import json
+import hashlib
+import sqlite3
+
+_KEEP_DAYS = 30
+
+
+def record_hash(lines):
+    ''' The hash of the text lines of a record '''
+    return hashlib.blake2b("\n".join(lines).encode("utf-8"), digest_size=16).digest()
+
+
+def cache_key(transformer, args, state):
+    ''' The key of the transform results.
+        args is a dict of the arguments affecting the output and state
+        a string describing the data collected by phase1 and phase2.
+    '''
+    data = json.dumps([transformer.__name__,
+                       getattr(transformer, "version", getattr(transformer, "_VERSION", "")),
+                       sorted(args.items()),
+                       state], default=str)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class TransformCache(object):
+    '''
+    Stored results of one transform key.
+
+    Usage:
+        with TransformCache("transform_cache.db", key) as cache:
+            result = cache.get(h)
+            if result is None:
+                result = (lines, printed)
+                cache.put(h, *result)
+    '''
+
+    def __init__(self, filename, key):
+        self.filename = filename
+        self.key = key
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        self.db = sqlite3.connect(self.filename)
+        self.db.execute("CREATE TABLE IF NOT EXISTS records ("
+                        "key TEXT, hash BLOB, lines TEXT, printed TEXT, used REAL, "
+                        "PRIMARY KEY (key, hash))")
+        self.now = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            # Forget the records which have not been used for a long time
+            self.db.execute("DELETE FROM records WHERE used < ?",
+                            (self.now - _KEEP_DAYS * 24 * 3600,))
+            self.db.commit()
+        else:
+            self.db.rollback()
+        self.db.close()
+
+    def get(self, h):
+        ''' Returns the stored (lines, printed text) of a record hash or None '''
+        row = self.db.execute("SELECT lines, printed FROM records WHERE key = ? AND hash = ?",
+                              (self.key, h)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute("UPDATE records SET used = ? WHERE key = ? AND hash = ?",
+                        (self.now, self.key, h))
+        return (row[0].split("\n") if row[0] else []), row[1]
+
+    def put(self, h, lines, printed):
+        ''' Stores the lines and the printed text of a record hash '''
+        self.db.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)",
+                        (self.key, h, "\n".join(lines), printed, self.now))
@@ -0,0 +1,173 @@
+'''
+Table of the level 0 records and the pointers between them.
+
+The table is built by the core during the first traverse (phase1) and given
+to the transform in run_args['xref_table']. During phase1 it contains the
+lines read so far, in phase2 and phase3 the whole input.
+
+For each record "0 @X@ TYPE" it stores the type and the line numbers of the
+first and the last line of the record, and for each pointer line
+"n TAG @Y@" (TAG one of REF_TAGS) of the record the tag, the target and the
+line number. The xrefs are mapped to integer ids and the data is kept in
+arrays indexed by the ids, so a query is a few list lookups.
+
+Usage:
+    table = run_args['xref_table']
+    table.type('@F0001@')                       # 'FAM'
+    table.lines('@F0001@')                      # (120, 131)
+    table.targets('@F0001@', 'HUSB')            # ['@I0001@']
+    for record, tag, linenum in table.referrers('@S0001@', 'SOUR'): ...
+'''
+
+from array import array
+
+# The pointer tags stored in the table
+REF_TAGS = ("HUSB", "WIFE", "CHIL", "FAMS", "FAMC", "SOUR", "NOTE")
+_REF_CODES = {tag: code for code, tag in enumerate(REF_TAGS)}
+
+
+class XrefTable(object):
+    '''
+    The records and the pointers of a GEDCOM file.
+
+    A pointer target which has no record (yet) has the type None.
+    '''
+
+    def __init__(self):
+        self.ids = {}               # xref -> id
+        self.xrefs = []             # id -> xref
+        self.type_names = []        # type code -> type name
+        self._type_codes = {}
+        # Indexed by the record id
+        self.rtype = array('i')     # type code, -1 if no record
+        self.first = array('l')     # line number of the level 0 line
+        self.last = array('l')      # line number of the last line
+        self.ref_begin = array('l') # the pointers of the record are
+        self.ref_end = array('l')   #   ref_begin <= i < ref_end
+        self.ref_first = array('l') # the first pointer to the record or -1
+        self.ref_last = array('l')  # the last pointer to the record or -1
+        # Indexed by the pointer number
+        self.ref_tag = array('b')   # index in REF_TAGS
+        self.ref_source = array('l')# id of the record containing the pointer
+        self.ref_target = array('l')# id of the record pointed to
+        self.ref_line = array('l')  # line number of the pointer line
+        self.ref_next = array('l')  # the next pointer to the same target or -1
+        self.current = -1           # id of the record being read
+        self.linenum = -1           # line number of the previous line
+
+    def __len__(self):
+        return len(self.xrefs)
+
+    def __contains__(self, xref):
+        xid = self.ids.get(xref)
+        return xid is not None and self.rtype[xid] >= 0
+
+    def _id(self, xref):
+        ''' Returns the id of an xref; a new id is added for an unknown xref '''
+        xid = self.ids.get(xref)
+        if xid is None:
+            xid = len(self.xrefs)
+            self.ids[xref] = xid
+            self.xrefs.append(xref)
+            self.rtype.append(-1)
+            self.first.append(-1)
+            self.last.append(-1)
+            self.ref_begin.append(0)
+            self.ref_end.append(0)
+            self.ref_first.append(-1)
+            self.ref_last.append(-1)
+        return xid
+
+    def add(self, gedline):
+        ''' Stores a line read in phase1 '''
+        if gedline.level == 0:
+            self.close()
+            if gedline.tag[:1] == "@":
+                xid = self._id(gedline.tag)
+                rtype = gedline.value
+                code = self._type_codes.get(rtype)
+                if code is None:
+                    code = self._type_codes[rtype] = len(self.type_names)
+                    self.type_names.append(rtype)
+                self.rtype[xid] = code
+                self.first[xid] = gedline.linenum
+                self.ref_begin[xid] = self.ref_end[xid] = len(self.ref_tag)
+                self.current = xid
+        elif self.current >= 0 and gedline.tag in _REF_CODES:
+            value = gedline.value
+            if value[:1] == "@":
+                self._add_ref(_REF_CODES[gedline.tag], self._id(value), gedline.linenum)
+        self.linenum = gedline.linenum
+
+    def _add_ref(self, code, target, linenum):
+        num = len(self.ref_tag)
+        self.ref_tag.append(code)
+        self.ref_source.append(self.current)
+        self.ref_target.append(target)
+        self.ref_line.append(linenum)
+        self.ref_next.append(-1)
+        if self.ref_first[target] < 0:
+            self.ref_first[target] = num
+        else:
+            self.ref_next[self.ref_last[target]] = num
+        self.ref_last[target] = num
+        self.ref_end[self.current] = num + 1
+
+    def close(self):
+        ''' Ends the current record; called at the end of the input '''
+        if self.current >= 0:
+            self.last[self.current] = self.linenum
+            self.current = -1
+
+    def type(self, xref):
+        ''' The type of the record, e.g. 'INDI', or None '''
+        xid = self.ids.get(xref)
+        if xid is None or self.rtype[xid] < 0:
+            return None
+        return self.type_names[self.rtype[xid]]
+
+    def lines(self, xref):
+        ''' The line numbers (first, last) of the record or None '''
+        xid = self.ids.get(xref)
+        if xid is None or self.rtype[xid] < 0:
+            return None
+        return self.first[xid], self.last[xid]
+
+    def of_type(self, rtype):
+        ''' The xrefs of the records of given type '''
+        code = self._type_codes.get(rtype)
+        return [self.xrefs[xid] for xid, c in enumerate(self.rtype) if c == code]
+
+    def refs(self, xref, tag=None):
+        ''' The pointers (tag, target xref, line number) of the record '''
+        xid = self.ids.get(xref)
+        if xid is None:
+            return []
+        code = _REF_CODES.get(tag)
+        return [(REF_TAGS[self.ref_tag[i]], self.xrefs[self.ref_target[i]], self.ref_line[i])
+                for i in range(self.ref_begin[xid], self.ref_end[xid])
+                if tag is None or self.ref_tag[i] == code]
+
+    def targets(self, xref, tag):
+        ''' The xrefs pointed to from the record with given tag, e.g. targets('@F1@', 'CHIL') '''
+        return [target for _tag, target, _linenum in self.refs(xref, tag)]
+
+    def target(self, xref, tag):
+        ''' The first xref pointed to with given tag or None '''
+        targets = self.targets(xref, tag)
+        return targets[0] if targets else None
+
+    def referrers(self, xref, tag=None):
+        ''' The pointers to the record: (source record xref, tag, line number) '''
+        xid = self.ids.get(xref)
+        ret = []
+        if xid is None:
+            return ret
+        code = _REF_CODES.get(tag)
+        i = self.ref_first[xid]
+        while i >= 0:
+            if tag is None or self.ref_tag[i] == code:
+                ret.append((self.xrefs[self.ref_source[i]], REF_TAGS[self.ref_tag[i]],
+                            self.ref_line[i]))
+            i = self.ref_next[i]
+        return ret
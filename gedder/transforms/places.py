@@ -4,8 +4,28 @@ Tries to recognize place names and order them correctly
 """
 
 version = "1.0"
-
-from collections import defaultdict 
+parallel_safe = True    # phase3 depends only on the plan given to initialize() in run_args
+
+from collections import defaultdict, Counter
+import csv
+import json
+import logging
+LOG = logging.getLogger(__name__)
+
+from transforms.model.lru_cache import LRUCache
+from transforms.model.gazetteer import load_snapshot
+from transforms.model.fuzzy_index import FuzzyIndex
+from transforms.model.gedcom_io import open_output, STREAM
+
+_CACHE_SIZE = 100000    # Number of distinct places remembered
+_PARISHFILE = "static/seurakunnat.txt"
+_VILLAGEFILE = "static/kylat.txt"
+_SNAPSHOT = "static/gazetteer.snapshot"
+_GAZETTEER_VERSION = "1"    # Change when read_gazetteer() or auto_combine() changes
+# The options (besides --match) affecting the result of process_place()
+_PLACE_OPTIONS = ('add_commas', 'auto_combine', 'minlen', 'ignore_digits',
+                  'ignore_lowercase', 'auto_order', 'reverse', 'fuzzy')
+_REPORT_CONTEXTS = ('BIRT', 'DEAT', 'MARR', 'RESI')    # Columns of --report, the rest are "other"
 
 ignored_text = """
 mlk
@@ -50,6 +70,11 @@ def add_args(parser):
                         help='Try to discover correct order...')
     parser.add_argument('--auto-combine', action='store_true',
                         help='Try to combine certain names...')
+    parser.add_argument('--fuzzy', type=int, nargs='?', const=1, default=0,
+                        help='Like --auto-order, but accept parishes and villages with at '
+                             'most FUZZY typos (default 1); the matches are logged')
+    parser.add_argument('--majority-order', action='store_true',
+                        help='Use the most common order of the same names in the file')
     parser.add_argument('--match', type=str, action='append',
                         help='Only process places containing any match string')
     parser.add_argument('--display-nonchanges', action='store_true',
@@ -58,21 +83,74 @@ def add_args(parser):
                         help='Display ignored places')
     parser.add_argument('--mark-changes', action='store_true',
                         help='Replace changed PLAC tags with PLAC-X')
+    parser.add_argument('--report', choices=('csv', 'json'),
+                        help='Only report the distinct places, their counts by event, '
+                             'gazetteer matches and results; no output file is written')
+    parser.add_argument('--report-file', type=str,
+                        help='File for --report (default: standard output)')
                         
 def initialize(run_args):
-    read_parishes("static/seurakunnat.txt")
-    read_villages("static/kylat.txt")
-
+    global parishes, villages
+    # The parsed lists are kept in a snapshot file, see transforms.model.gazetteer
+    parishes, villages = load_snapshot(_SNAPSHOT, [_PARISHFILE, _VILLAGEFILE],
+                                       read_gazetteer, _GAZETTEER_VERSION)
+    place_cache.clear()
+    fuzzy_indexes.clear()
+    fuzzy_matches.clear()
+    place_counts.clear()
+    place_contexts.clear()
+    place_overrides.clear()
+    # The --majority-order decisions of phase2 are passed to the --jobs workers in run_args
+    place_overrides.update(run_args.get('place_overrides') or {})
+
+def need_phase1(run_args):
+    # The places are counted only for --majority-order and --report; otherwise
+    # phase3 plans each place with the cache of plan_place()
+    return bool(run_args.get('majority_order') or run_args.get('report'))
+
+def skip_output(run_args):
+    return bool(run_args.get('report'))
+
+def phase1(run_args, gedline):
+    if gedline.tag == "PLAC" and gedline.value:
+        place_counts[gedline.value] += 1
+        if run_args.get('report'):
+            place_contexts[gedline.value][place_context(gedline)] += 1
 
 def phase2(run_args):
-    pass
+    # Each distinct place is planned once; phase3 gets the plans from the
+    # cache of plan_place() and only the --majority-order decisions are kept
+    run_args.pop('place_overrides', None)
+    if not need_phase1(run_args):
+        return
+    plan = {place: plan_place(run_args, place) for place in place_counts}
+    if run_args.get('majority_order'):
+        overrides = majority_order(place_counts, plan)
+        plan.update(overrides)
+        place_overrides.update(overrides)
+        run_args['place_overrides'] = overrides
+    LOG.info("Paikkoja %s, erilaisia %s", sum(place_counts.values()), len(place_counts))
+    if run_args.get('report'):
+        write_report(run_args, report_rows(place_counts, place_contexts, plan))
+        place_contexts.clear()
+    place_counts.clear()
+
+def cache_state(run_args):
+    # The place lists read in initialize, for the --incremental cache; the
+    # --majority-order decisions are in run_args['place_overrides']
+    return repr((sorted(parishes), sorted((k, sorted(v)) for k, v in villages.items())))
 
 def phase3(run_args,gedline,f):
     if gedline.tag == "PLAC":
         if not gedline.value: 
             return
         place = gedline.value
-        newplace = process_place(run_args, place)
+        result = place_overrides.get(place)
+        if result is None:
+            result = plan_place(run_args, place)
+        newplace, ignored = result
+        if ignored and run_args['display_ignored']:
+            print("ignored: " + place)
         if newplace != place: 
             #if run_args['display_changes']:
             #    print("'{}' -> '{}'".format(place,newplace))
@@ -83,8 +161,23 @@ def phase3(run_args,gedline,f):
             if run_args['display_nonchanges']:
                 print("Not changed: '{}'".format(place))
     gedline.emit(f)
+
+def finalize(run_args):
+    overrides = run_args.get('place_overrides')
+    if overrides:
+        LOG.info("Enemmistön järjestykseen muutettuja paikkoja %s", len(overrides))
+    if (place_cache.hits or place_cache.misses) and not run_args.get('parallel_phase3'):
+        LOG.info("Paikkojen välimuisti: %s osumaa, %s ohitusta, %s paikkaa",
+                 place_cache.hits, place_cache.misses, len(place_cache))
+    if run_args.get('parallel_phase3') and not need_phase1(run_args):
+        # The places were matched in the --jobs workers, which log each match
+        if run_args.get('fuzzy'):
+            LOG.info("Sumeasti tunnistettujen paikkojen määrä ei ole tiedossa rinnakkaisajossa")
+    elif fuzzy_matches:
+        LOG.info("Sumeasti tunnistettuja paikkoja %s", len(fuzzy_matches))
             
 ignored = [name.strip() for name in ignored_text.splitlines() if name.strip() != ""]
+_ignored_set = frozenset(ignored)
 
 parishes = set()
 
@@ -126,15 +219,29 @@ def read_villages(villagefile):
         village = village.strip().lower()
         villages[auto_combine(parish)].add(village)
 
+def read_gazetteer(parishfile, villagefile):
+    """ Reads the parishes and the villages of each parish from the text files """
+    global parishes, villages
+    parishes = set()
+    villages = defaultdict(set)
+    read_parishes(parishfile)
+    read_villages(villagefile)
+    return parishes, villages
+
 def ignore(run_args, names):
+    if not names:
+        return False
+    minlen = run_args['minlen']
+    ignore_digits = run_args['ignore_digits']
+    ignore_lowercase = run_args['ignore_lowercase']
     for name in names:
-        if len(name) < run_args['minlen']:
+        if len(name) < minlen:
             return True
-        if name.lower() in ignored:
+        if name.lower() in _ignored_set:
             return True
-        if run_args['ignore_digits'] and numeric(name):
+        if ignore_digits and numeric(name):
             return True
-        if run_args['ignore_lowercase'] and name.islower(): 
+        if ignore_lowercase and name.islower(): 
             return True
     return False
 
@@ -152,6 +259,7 @@ auto_combines = [
     "n msrk",
     "n ksrk",
 ]
+_combine_words = tuple(s[2:] for s in auto_combines)
 
 
 def talonumerot(names):
@@ -181,33 +289,128 @@ def talonumerot(names):
     return names
 
 
+def replace_separator(place, old, new):
+    """ Replaces the separator old in each compound "n<old><word>" (word in auto_combines)
+        with new. The place is scanned once; only the positions of "n<old>" are
+        compared to the words.
+    """
+    sep = "n" + old
+    i = place.find(sep)
+    if i < 0:
+        return place
+    parts = []
+    start = 0
+    while i >= 0:
+        if place.startswith(_combine_words, i + 2):
+            parts.append(place[start:i + 1])
+            parts.append(new)
+            start = i + 2
+        i = place.find(sep, i + 2)
+    if not parts:
+        return place
+    parts.append(place[start:])
+    return "".join(parts)
+
 def auto_combine(place):
-    for s in auto_combines:
-        place = place.replace(s,s.replace(" ","-"))
-    return place
+    return replace_separator(place, " ", "-")
     
 def revert_auto_combine(place):
-    for s in auto_combines:
-        place = place.replace(s.replace(" ","-"),s)
-    return place
+    return replace_separator(place, "-", " ")
+
+fuzzy_indexes = {}      # None -> index of the parishes, parish -> index of it's villages
+fuzzy_matches = {}      # place -> (parish, village) matched with typos
+
+def fuzzy_index(parish=None):
+    """ The FuzzyIndex of the parishes or of the villages of a parish """
+    index = fuzzy_indexes.get(parish)
+    if index is None:
+        index = FuzzyIndex(parishes if parish is None else villages.get(parish, ()))
+        fuzzy_indexes[parish] = index
+    return index
+
+def fuzzy_parish_village(parish, village, max_distance):
+    """ The nearest (parish, village) in the gazetteer within max_distance typos in
+        each name, or None
+    """
+    if parish not in parishes:
+        match = fuzzy_index().best(parish, max_distance)
+        if match is None:
+            return None
+        parish = match[0]
+    if village not in villages.get(parish, ()):
+        match = fuzzy_index(parish).best(village, max_distance)
+        if match is None:
+            return None
+        village = match[0]
+    return parish, village
 
 def stringmatch(place,matches):
     for match in matches:
-        if place.find(match) >= 0: return True
+        if match in place: return True
     return False
     
-def process_place(run_args, place): 
+place_cache = LRUCache(_CACHE_SIZE)     # (place, options) -> (new place, ignored)
+place_counts = Counter()                # place -> number of PLAC lines, collected in phase1
+place_overrides = {}                    # place -> (new place, False), the --majority-order decisions
+place_contexts = defaultdict(Counter)   # place -> event tag -> number of PLAC lines, for --report
+
+def plan_place(run_args, place):
+    """ Returns the new place and True, if the place was ignored; the result
+        (never None) is kept in place_cache
+    """
+    match = run_args.get('match')
+    options = tuple(run_args.get(name) for name in _PLACE_OPTIONS)
+    key = (place, tuple(match) if match else None, options)
+    result = place_cache.get(key)
+    if result is None:
+        result = transform_place(run_args, place)
+        place_cache.put(key, result)
+    return result
+
+def process_place(run_args, place):
+    newplace, ignored = plan_place(run_args, place)
+    if ignored and run_args['display_ignored']:
+        print("ignored: " + place)
+    return newplace
+
+def majority_order(counts, plan):
+    """ Finds the places whose names are in the file also in another order, which
+        is more common (counted by the PLAC lines after the transform).
+        Returns {place: (the names in that order, False)}
+    """
+    orders = defaultdict(Counter)   # sorted names -> order of the names -> count
+    for place, count in counts.items():
+        newplace, ignored = plan[place]
+        if ignored or "," not in newplace:
+            continue
+        order = tuple(name.strip().lower() for name in newplace.split(","))
+        orders[tuple(sorted(order))][order] += count
+    overrides = {}
+    for place in counts:
+        newplace, ignored = plan[place]
+        if ignored or "," not in newplace:
+            continue
+        names = [name.strip() for name in newplace.split(",")]
+        order = tuple(name.lower() for name in names)
+        common = orders[tuple(sorted(order))].most_common(2)
+        if len(common) < 2 or common[0][0] == order or common[0][1] == common[1][1]:
+            # The only order, the most common one or a tie
+            continue
+        spelled = {name.lower(): name for name in names}
+        overrides[place] = (", ".join(spelled[name] for name in common[0][0]), False)
+    return overrides
+
+def transform_place(run_args, place): 
+    """ Returns the new place and True, if the place was ignored """
     orig_place = place
     if run_args['match'] and not stringmatch(place,run_args['match']):
-        return place
+        return place, False
     if run_args['add_commas'] and "," not in place:
         if run_args['auto_combine']:
             place = auto_combine(place)
         names = place.split()
         if ignore(run_args, names): 
-            if run_args['display_ignored']:
-                print("ignored: " + orig_place)
-            return orig_place
+            return orig_place, True
         names = talonumerot(names)
         place = ", ".join(names)
     if "," in place:
@@ -215,14 +418,23 @@ def process_place(run_args, place):
         if len(names) == 1: 
             if run_args['auto_combine']:
                 place = revert_auto_combine(place)
-            return place
+            return place, False
         do_reverse = False
-        if run_args['auto_order']:
+        if run_args['auto_order'] or run_args.get('fuzzy'):
             #print(sorted(parishes))
             #print(sorted(villages["helsingin-pitäjä"]))
             #print(names)
             if names[0].lower() in parishes and names[1].lower() in villages[names[0].lower()] and names[-1] not in countries:
                 do_reverse = True
+            elif names[1].lower() in parishes and names[0].lower() in villages.get(names[1].lower(), ()):
+                # Already in the order village, parish; not to be "corrected" by --fuzzy
+                pass
+            elif run_args.get('fuzzy') and names[-1] not in countries:
+                match = fuzzy_parish_village(names[0].lower(), names[1].lower(), run_args['fuzzy'])
+                if match:
+                    do_reverse = True
+                    fuzzy_matches[orig_place] = match
+                    LOG.info("Sumea paikka '%s': %s, %s", orig_place, *match)
             if names[0] in countries:
                 do_reverse = True
         if run_args['reverse'] or do_reverse:
@@ -230,10 +442,71 @@ def process_place(run_args, place):
             place = ", ".join(names)
     if run_args['auto_combine']:
         place = revert_auto_combine(place)
-    return place
+    return place, False
  
 
 
+def place_context(gedline):
+    """ The event of a PLAC line in the columns of --report, or "other" """
+    tags = gedline.tags
+    if len(tags) > 1 and tags[-2] in _REPORT_CONTEXTS:
+        return tags[-2]
+    return "other"
+
+def gazetteer_match(place):
+    """ "parish+village", if the place contains a parish and a village of it,
+        "parish", if it contains a parish, otherwise ""
+    """
+    text = auto_combine(place.lower())
+    if "," in text:
+        names = [name.strip() for name in text.split(",")]
+    else:
+        names = text.split()
+    found = [name for name in names if name in parishes]
+    for parish in found:
+        parish_villages = villages.get(parish, ())
+        if any(name in parish_villages for name in names if name != parish):
+            return "parish+village"
+    return "parish" if found else ""
+
+def report_rows(counts, contexts, plan):
+    """ The rows of --report sorted by the number of PLAC lines (descending) and the place """
+    rows = []
+    for place, count in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+        newplace, ignored = plan[place]
+        row = {'place': place, 'count': count}
+        for context in _REPORT_CONTEXTS + ("other",):
+            row[context] = contexts[place][context]
+        row['gazetteer'] = gazetteer_match(place)
+        row['result'] = newplace
+        row['ignored'] = ignored
+        rows.append(row)
+    return rows
+
+def write_report(run_args, rows):
+    """ Writes the rows of --report as CSV or JSON to run_args['report_file'] or stdout """
+    name = run_args.get('report_file')
+    if name:
+        f = open(name, "w", encoding="utf-8", newline="")
+    else:
+        # The standard output even if the messages are printed to stderr
+        f = open_output(STREAM, "utf-8")
+    try:
+        if run_args['report'] == "json":
+            json.dump(rows, f, ensure_ascii=False, indent=1)
+            f.write("\n")
+        else:
+            fields = ['place', 'count'] + list(_REPORT_CONTEXTS) + ['other', 'gazetteer',
+                                                                  'result', 'ignored']
+            writer = csv.DictWriter(f, fields, lineterminator="\n")
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(dict(row, ignored=int(row['ignored'])))
+    finally:
+        f.close()
+    LOG.info("Paikkaraportti: %s erilaista paikkaa", len(rows))
+
+
 def check(in_file, expected_output, reverse=False, add_commas=False, 
           ignore_lowercase=False, ignore_digits=False):
     class Args: pass
@@ -244,7 +517,7 @@ def check(in_file, expected_output, reverse=False, add_commas=False,
                 'display_ignored': False,
                 'auto_order': True,
                 'auto_combine': True,
-                'min_len': 0,
+                'minlen': 0,
                 'match': None
                 }
  
@@ -275,10 +548,11 @@ def test():
     check("Stratford upon Avon","Stratford, upon, Avon",add_commas=True,ignore_lowercase=False)
     check("Stratford upon Avon","Stratford upon Avon",add_commas=True,ignore_lowercase=True)
     
-    check("Äyräpää Vuosalmi N:o 4", "Äyräpää, Vuosalmi, N:o, 4",add_commas=True,ignore_digits=False)
+    check("Äyräpää Vuosalmi N:o 4", "Äyräpää, Vuosalmi, N:o, N:o 4",add_commas=True,ignore_digits=False)
     check("Äyräpää Vuosalmi N:o 4", "Äyräpää Vuosalmi N:o 4",add_commas=True,ignore_digits=True)
-    check("Kuopio Vehmasmäki 8", "Kuopio, Vehmasmäki, Vehmasmäki 8 ",add_commas=True,ignore_digits=False)
-    check("Maaninka Kurolanlahti 6 Viemäki ", "ÄMaaninka, Kurolanlahti, Kurolanlahti 6 Viemäki",add_commas=True,ignore_digits=False)
+    check("Kuopio Vehmasmäki 8", "Kuopio, Vehmasmäki, Vehmasmäki 8",add_commas=True,ignore_digits=False)
+    # --auto-order reverses the place, as Kurolanlahti is a village of Maaninka
+    check("Maaninka Kurolanlahti 6 Viemäki ", "Kurolanlahti 6 Viemäki, Kurolanlahti, Maaninka",add_commas=True,ignore_digits=False)
 
 
     
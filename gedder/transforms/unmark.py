@@ -4,6 +4,7 @@ Restores marked tags: <tag>-X -> <tag>
 """
 
 _VERSION = "1.0"
+parallel_safe = True    # phase3 does not depend on other records
 #from transforms.model.gedcom_line import GedcomLine
 
 def add_args(parser):
@@ -16,4 +17,4 @@ def phase3(run_args, gedline, f):
     if gedline.tag.endswith("-X"):
         gedline.tag = gedline.tag[:-2]
 #       line = "{} {} {}".format(gedline.level, gedline.tag, gedline.value)
-    f.emit(gedline.get_line())
+    gedline.emit(f)
@@ -98,6 +98,7 @@ class Handler:
         print("Lokitiedot: {!r}".format(_LOGFILE))
         self.init_log()
         disp_cmd = self.op_selected
+        self.run_args['progress_callback'] = self.on_progress
         gedcom_transform.process_gedcom(self.run_args, self.transformer, task_name=disp_cmd)
 
         self.st.push(self.st_id, "{} tehty".format(button.get_label()))
@@ -106,6 +107,18 @@ class Handler:
         ''' Show report '''
         self.on_showButton_clicked(button)
         
+    def on_progress(self, info):
+        ''' Show the progress of the transformation in the statusbar '''
+        msg = "{} {} riviä".format(info.phase, info.lines)
+        if info.total:
+            msg += ", {:.0f} %".format(100.0 * min(info.done, info.total) / info.total)
+        if info.eta is not None and not info.finished:
+            msg += ", jäljellä {:.0f} s".format(info.eta)
+        self.st.push(self.st_id, msg)
+        # The transformation runs in the UI thread: let Gtk redraw the window
+        while Gtk.events_pending():
+            Gtk.main_iteration()
+
     def on_revertButton_clicked(self, button):
         #TODO: peru muutokset kopioimalla viimeisin talletettu syöte uusimmaksi
         self.st.push(self.st_id, "Painettu: " + button.get_label())